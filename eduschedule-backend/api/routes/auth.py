@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, EmailStr
 from typing import Dict
-import random
+from hashlib import blake2b
 from datetime import datetime, timedelta
 
-from core.dependencies import get_current_user, supabase
+from core.dependencies import get_current_user, db, run_query
+from core.loaders import get_profile_cached
 
 router = APIRouter(
     prefix="/api/auth",
@@ -15,8 +16,12 @@ class UserCreate(BaseModel):
     email: EmailStr
     name: str
 
+def _offers_deal(email: str) -> bool:
+    """Deterministic 50% split on the email, so re-verifying a user gives the same answer."""
+    return blake2b(email.encode(), digest_size=1, person=b'deal').digest()[0] < 128
+
 @router.post("/verify")
-def verify_and_create_user(user_data: UserCreate, current_user: dict = Depends(get_current_user)):
+async def verify_and_create_user(user_data: UserCreate, current_user: dict = Depends(get_current_user)):
     """
     Verifies Supabase token and ensures a profile exists in the 'profiles' table.
     """
@@ -27,10 +32,10 @@ def verify_and_create_user(user_data: UserCreate, current_user: dict = Depends(g
     if email != user_data.email:
         raise HTTPException(status_code=400, detail="Token email does not match payload email")
 
-    # Check if profile already exists
-    response = supabase.table('profiles').select("*").eq('id', user_id).execute()
+    # Check if profile already exists (repeat verifies on page load hit the cache)
+    profile = await get_profile_cached(user_id)
 
-    if not response.data:
+    if not profile:
         # Profile does not exist, create it
         user_record = {
             'id': user_id,  # Link to auth.users
@@ -41,15 +46,15 @@ def verify_and_create_user(user_data: UserCreate, current_user: dict = Depends(g
         }
 
         # --- CHANCE DEAL LOGIC ---
-        if random.random() < 0.5:
+        if _offers_deal(email):
             now = datetime.utcnow()
             user_record['deal_offered_at'] = now.isoformat()
             user_record['deal_expires_at'] = (now + timedelta(hours=24)).isoformat()
         # --- END DEAL LOGIC ---
 
-        insert_response = supabase.table('profiles').insert(user_record).execute()
+        insert_response = await run_query(db.table('profiles').insert(user_record))
         if not insert_response.data:
             raise HTTPException(status_code=500, detail="Could not create user profile.")
         return {"message": "User verified and created successfully.", "user": insert_response.data[0]}
 
-    return {"message": "User verified successfully.", "user": response.data[0]}
+    return {"message": "User verified successfully.", "user": profile}
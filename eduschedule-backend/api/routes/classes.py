@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List
 from uuid import UUID
-from core.dependencies import get_current_user, supabase
-from core.permissions import check_plan_limits
+from core.dependencies import get_current_user, db, run_query, select_columns, returning, rows_response
+from core.permissions import check_plan_limits, record_usage_change
 from schemas.data_models import ClassBase, ClassCreate
 
 router = APIRouter(
@@ -12,20 +12,21 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=ClassBase, status_code=status.HTTP_201_CREATED)
-def create_class(
+async def create_class(
     class_item: ClassCreate,
     user: dict = Depends(get_current_user),
     _: dict = Depends(check_plan_limits("classes"))
 ):
     """Create a new class. Plan limits enforced."""
-    class_data = class_item.dict()
+    class_data = class_item.model_dump(mode='json')
     class_data['user_id'] = user.id
-    response = supabase.table('classes').insert(class_data).execute()
+    response = await run_query(returning(db.table('classes').insert(class_data), select_columns(ClassBase)))
     if not response.data:
         raise HTTPException(status_code=400, detail="Failed to create class.")
+    await record_usage_change(class_data['user_id'], 'classes', 1)
     return response.data[0]
 
-@router.get("/", response_model=List[ClassBase])
-def list_classes():
-    response = supabase.table('classes').select("*").execute()
-    return response.data
+@router.get("/", responses={200: {"model": List[ClassBase]}})
+async def list_classes():
+    response = await run_query(db.table('classes').select(select_columns(ClassBase)))
+    return rows_response(response.data)
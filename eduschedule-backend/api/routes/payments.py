@@ -2,15 +2,31 @@ import os
 import uuid
 import hashlib
 import hmac
-from fastapi import APIRouter, Depends, HTTPException, Request, Body, Header
+import httpx
+import orjson
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Body, Header
 from pydantic import BaseModel
-from paystackapi.paystack import Paystack
-from core.dependencies import get_current_user, supabase
+from redis.exceptions import RedisError
+from core.dependencies import get_current_user, db, run_query
+from core.cache import redis_client, invalidate_profile
+from core.logger import get_logger
+
+logger = get_logger(__name__)
 
 # Initialize Paystack
 PAYSTACK_SECRET = os.environ.get("PAYSTACK_SECRET_KEY")
-paystack = Paystack(secret_key=PAYSTACK_SECRET)
+PAYSTACK_API_URL = "https://api.paystack.co"
+# Shared keep-alive client; closed on app shutdown
+paystack_client = httpx.AsyncClient(
+    base_url=PAYSTACK_API_URL,
+    headers={"Authorization": f"Bearer {PAYSTACK_SECRET}"},
+    timeout=10.0,
+)
+# Encoded once here; the webhook HMAC needs bytes on every call
+PAYSTACK_SECRET_BYTES = PAYSTACK_SECRET.encode('utf-8') if PAYSTACK_SECRET else None
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:5173")
+# Paystack retries an event for up to a day; remember processed ids that long
+WEBHOOK_IDEMPOTENCY_TTL = 86400
 
 router = APIRouter(prefix="/api/payments", tags=["Payments"])
 
@@ -19,58 +35,99 @@ class SubscriptionRequest(BaseModel):
     amount: int
 
 @router.post("/subscribe")
-def create_payment_link(
+async def create_payment_link(
     sub_request: SubscriptionRequest = Body(...),
     current_user: dict = Depends(get_current_user)
 ):
     email = current_user.email
     user_id = current_user.id
 
-    response = paystack.transaction.initialize(
-        reference=f"edu_{user_id}_{uuid.uuid4()}",
-        amount=sub_request.amount,
-        email=email,
-        callback_url=f"{FRONTEND_URL}/payment-success",
-        metadata={"user_id": user_id, "plan_id": sub_request.planId}
-    )
+    try:
+        paystack_response = await paystack_client.post("/transaction/initialize", json={
+            "reference": f"edu_{user_id}_{uuid.uuid4()}",
+            "amount": sub_request.amount,
+            "email": email,
+            "callback_url": f"{FRONTEND_URL}/payment-success",
+            "metadata": {"user_id": user_id, "plan_id": sub_request.planId}
+        })
+        response = paystack_response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        logger.error(f"Paystack initialize failed: {e}")
+        raise HTTPException(status_code=400, detail="Could not initialize payment.")
 
     if response.get('status'):
         return {"authorization_url": response['data']['authorization_url']}
     else:
         raise HTTPException(status_code=400, detail="Could not initialize payment.")
 
+async def _first_delivery(event_id) -> bool:
+    """
+    Claim a Paystack event id in Redis. Returns False if it was already processed.
+    Fails open when Redis is unavailable, since the profile update is idempotent.
+    """
+    try:
+        return bool(await redis_client.set(f"pstk:{event_id}", "1", nx=True, ex=WEBHOOK_IDEMPOTENCY_TTL))
+    except RedisError as e:
+        logger.warning(f"Webhook idempotency check skipped: {e}")
+        return True
+
+async def _activate_premium(user_id: str, event_id=None):
+    try:
+        # In a real app, calculate actual expiry date based on plan
+        await run_query(db.table('profiles').update({
+            "plan": "premium",
+            "subscription_status": "active"
+        }).eq('id', user_id))
+        await invalidate_profile(user_id)
+    except Exception as e:
+        logger.error(f"Premium activation failed for {user_id}: {e}")
+        # Release the claim so Paystack's next retry is processed
+        if event_id is not None:
+            try:
+                await redis_client.delete(f"pstk:{event_id}")
+            except RedisError:
+                pass
+
 @router.post("/webhook")
-async def paystack_webhook(request: Request, x_paystack_signature: str = Header(None)):
+async def paystack_webhook(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    x_paystack_signature: str = Header(None)
+):
     """
     Secure Webhook endpoint.
+    Replayed events are acknowledged without reprocessing, and the profile
+    update runs after the response so Paystack gets its 200 quickly.
     """
     body_bytes = await request.body()
 
     # 1. Verify Signature
-    if not PAYSTACK_SECRET:
-        print("Error: PAYSTACK_SECRET_KEY not set")
+    if not PAYSTACK_SECRET_BYTES:
+        logger.error("PAYSTACK_SECRET_KEY not set")
         return {"status": "error"}
 
-    hash_obj = hmac.new(PAYSTACK_SECRET.encode('utf-8'), body_bytes, hashlib.sha512)
+    hash_obj = hmac.new(PAYSTACK_SECRET_BYTES, body_bytes, hashlib.sha512)
     expected_signature = hash_obj.hexdigest()
 
-    if x_paystack_signature != expected_signature:
+    # Constant-time comparison so the signature can't be probed byte by byte
+    if not hmac.compare_digest(x_paystack_signature or "", expected_signature):
         raise HTTPException(status_code=403, detail="Invalid signature")
 
-    # 2. Process Event
-    body = await request.json()
+    # 2. Process Event (parse the bytes already read for the HMAC)
+    body = orjson.loads(body_bytes)
     event = body.get('event')
 
     if event == 'charge.success':
-        metadata = body['data'].get('metadata', {})
+        data = body['data']
+        metadata = data.get('metadata', {})
         user_id = metadata.get('user_id')
 
         if user_id:
+            event_id = data.get('id')
+            if event_id is not None and not await _first_delivery(event_id):
+                return {"status": "duplicate"}
+
             # Update user's profile to premium
-            # In a real app, calculate actual expiry date based on plan
-            supabase.table('profiles').update({
-                "plan": "premium",
-                "subscription_status": "active"
-            }).eq('id', user_id).execute()
+            background_tasks.add_task(_activate_premium, user_id, event_id)
 
     return {"status": "ok"}
@@ -1,20 +1,80 @@
-from fastapi import APIRouter
-from core.dependencies import supabase
+import asyncio
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+import orjson
+from fastapi import APIRouter, Query
+from fastapi.responses import Response, StreamingResponse
+from core.dependencies import db, fetch_page
+from core.cache import public_timetable_cache, public_timetables_version
 
 router = APIRouter(prefix="/api/public", tags=["Public"])
 
+PUBLIC_TIMETABLE_COLUMNS = (
+    "id, term, type, generated_at, "
+    "assignments(id, class_id, subject_id, teacher_id, room_id, day_of_week, period)"
+)
+
+# Page loads in flight, keyed like the cache: concurrent misses for one page
+# share a single Supabase fetch, and misses for different pages don't wait on each other
+_inflight: Dict[Tuple[Optional[str], Optional[str], int], asyncio.Task] = {}
+
+async def _fetch_page(cursor: Optional[str], limit: int) -> dict:
+    """One keyset page of active timetables, ordered by id and starting after `cursor`."""
+    # timetables has no school column yet, so every school sees the same pages;
+    # the school_id in the URL is not part of the query or the cache key.
+    query = db.table('timetables').select(PUBLIC_TIMETABLE_COLUMNS).eq('active', True)
+    return await fetch_page(query, cursor, limit)
+
+async def _load_page(cache_key: Tuple[Optional[str], Optional[str], int]) -> bytes:
+    _, cursor, limit = cache_key
+    # Cache the serialized page so hits skip JSON encoding entirely
+    content = orjson.dumps(await _fetch_page(cursor, limit))
+    public_timetable_cache.set(cache_key, content)
+    return content
+
+async def _cached_page(cursor: Optional[str], limit: int) -> bytes:
+    # Pages cached under an older version are never read again and age out
+    cache_key = (await public_timetables_version(), cursor, limit)
+    cached = public_timetable_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    task = _inflight.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(_load_page(cache_key))
+        _inflight[cache_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(cache_key, None))
+    # Shielded: a client disconnecting doesn't cancel the load other requests await
+    return await asyncio.shield(task)
+
 @router.get("/timetables/{school_id}")
-def get_public_timetables(school_id: str):
+async def get_public_timetables(
+    school_id: str,
+    cursor: Optional[UUID] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
     """
-    Fetches all active timetables (academic, test, exam) for a given school.
+    Fetches active timetables (academic, test, exam) for a given school, one page at a time.
+    Pass the returned next_cursor to get the following page; it is null on the last page.
     This endpoint is public and does not require authentication.
+    Responses are cached for a short time; timetable writes clear the cache.
+    """
+    return Response(content=await _cached_page(str(cursor) if cursor else None, limit), media_type="application/json")
+
+@router.get("/timetables/{school_id}/stream")
+async def stream_public_timetables(school_id: str, limit: int = Query(20, ge=1, le=100)):
     """
-    # In a real multi-school system, you'd use school_id to filter.
-    # For now, we'll fetch all active timetables.
-    
-    response = supabase.table('timetables') \
-        .select("id, term, type, generated_at, assignments(*)") \
-        .eq('active', True) \
-        .execute().data
-        
-    return response
\ No newline at end of file
+    Streams every active timetable as JSON lines, one timetable per line,
+    fetching a page at a time so memory stays bounded.
+    """
+    async def generate():
+        cursor = None
+        while True:
+            page = await _fetch_page(cursor, limit)
+            for timetable in page["data"]:
+                yield orjson.dumps(timetable) + b"\n"
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
@@ -1,9 +1,12 @@
+import logging
 from fastapi import APIRouter, Depends, Body
 from typing import Dict, Any
 
 # Import the correct, existing dependency
 from core.dependencies import get_current_user
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/v1", 
     tags=["Public API v1"],
@@ -12,12 +15,12 @@ router = APIRouter(
 )
 
 @router.get("/status")
-def get_api_status():
+async def get_api_status():
     """A simple endpoint to check if the API is up and the user token is valid."""
     return {"status": "ok", "message": "User token is valid."}
 
 @router.post("/timetables/generate")
-def generate_timetable_via_api(
+async def generate_timetable_via_api(
     constraints: Dict[str, Any] = Body(...),
     current_user: dict = Depends(get_current_user)
 ):
@@ -27,7 +30,7 @@ def generate_timetable_via_api(
     # The user is now authenticated via their standard Supabase JWT
     user_id = current_user.id
     
-    print(f"API request received from user {user_id} with constraints: {constraints}")
+    logger.debug("API request received from user %s with constraints: %s", user_id, constraints)
     
     return {
         "message": f"Timetable generation job started for API user {user_id}.",
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List
 from uuid import UUID
-from core.dependencies import get_current_user, supabase
-from core.permissions import check_plan_limits
+from core.dependencies import get_current_user, db, run_query, select_columns, returning, rows_response
+from core.permissions import check_plan_limits, record_usage_change
 from schemas.data_models import RoomBase, RoomCreate
 
 router = APIRouter(
@@ -12,20 +12,21 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=RoomBase, status_code=status.HTTP_201_CREATED)
-def create_room(
+async def create_room(
     room: RoomCreate,
     user: dict = Depends(get_current_user),
     _: dict = Depends(check_plan_limits("rooms"))
 ):
     """Create a new room. Plan limits enforced."""
-    room_data = room.dict()
+    room_data = room.model_dump(mode='json')
     room_data['user_id'] = user.id
-    response = supabase.table('rooms').insert(room_data).execute()
+    response = await run_query(returning(db.table('rooms').insert(room_data), select_columns(RoomBase)))
     if not response.data:
         raise HTTPException(status_code=400, detail="Failed to create room.")
+    await record_usage_change(room_data['user_id'], 'rooms', 1)
     return response.data[0]
 
-@router.get("/", response_model=List[RoomBase])
-def list_rooms():
-    response = supabase.table('rooms').select("*").execute()
-    return response.data
+@router.get("/", responses={200: {"model": List[RoomBase]}})
+async def list_rooms():
+    response = await run_query(db.table('rooms').select(select_columns(RoomBase)))
+    return rows_response(response.data)
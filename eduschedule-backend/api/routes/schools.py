@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, Body, HTTPException
 from pydantic import BaseModel
-from core.dependencies import get_current_user, supabase
-from supabase import create_client, Client
+from core.dependencies import get_current_user, db, run_query
+from core.cache import invalidate_profile
 
 router = APIRouter(prefix="/api/schools", tags=["Schools"])
 
@@ -9,7 +9,7 @@ class SchoolCreate(BaseModel):
     name: str
 
 @router.post("/")
-def create_school(
+async def create_school(
     school_data: SchoolCreate = Body(...),
     current_user: dict = Depends(get_current_user)
 ):
@@ -20,20 +20,14 @@ def create_school(
     # Access the 'id' property directly from the Supabase user object
     user_id = current_user.id
 
-    # 1. Create the school
-    school_insert_response = supabase.table('schools').insert({
-        "name": school_data.name,
-        "owner_id": user_id
-    }).execute()
+    # Create the school and link the user's profile to it in one transaction
+    response = await run_query(db.rpc('create_school_and_link', {
+        "p_owner": user_id,
+        "p_name": school_data.name
+    }))
 
-    if not school_insert_response.data:
+    if not response.data:
         raise HTTPException(status_code=500, detail="Could not create school.")
 
-    new_school = school_insert_response.data[0]
-
-    # 2. Update the user's record in the 'profiles' table to link them to the new school
-    supabase.table('profiles').update({
-        "school_id": new_school['id']
-    }).eq('id', user_id).execute()
-
-    return new_school
+    await invalidate_profile(user_id)
+    return response.data
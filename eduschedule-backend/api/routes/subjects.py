@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List
 from uuid import UUID
-from core.dependencies import get_current_user, supabase
-from core.permissions import check_plan_limits
+from core.dependencies import get_current_user, db, run_query, select_columns, returning, rows_response
+from core.permissions import check_plan_limits, record_usage_change
 from schemas.data_models import SubjectBase, SubjectCreate
 
 router = APIRouter(
@@ -12,20 +12,21 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=SubjectBase, status_code=status.HTTP_201_CREATED)
-def create_subject(
+async def create_subject(
     subject: SubjectCreate,
     user: dict = Depends(get_current_user),
     _: dict = Depends(check_plan_limits("subjects"))
 ):
     """Create a new subject. Plan limits enforced."""
-    subject_data = subject.dict()
+    subject_data = subject.model_dump(mode='json')
     subject_data['user_id'] = user.id
-    response = supabase.table('subjects').insert(subject_data).execute()
+    response = await run_query(returning(db.table('subjects').insert(subject_data), select_columns(SubjectBase)))
     if not response.data:
         raise HTTPException(status_code=400, detail="Failed to create subject.")
+    await record_usage_change(subject_data['user_id'], 'subjects', 1)
     return response.data[0]
 
-@router.get("/", response_model=List[SubjectBase])
-def list_subjects():
-    response = supabase.table('subjects').select("*").execute()
-    return response.data
+@router.get("/", responses={200: {"model": List[SubjectBase]}})
+async def list_subjects():
+    response = await run_query(db.table('subjects').select(select_columns(SubjectBase)))
+    return rows_response(response.data)
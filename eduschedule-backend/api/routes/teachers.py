@@ -1,13 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Body
+from typing import Optional
 from uuid import UUID
-from pydantic import BaseModel, EmailStr
-import os
+from fastapi.concurrency import run_in_threadpool
+from pydantic import EmailStr
 
-from core.dependencies import get_current_user, supabase
-from core.rbac import admin_required, teacher_or_admin_required, require_permission, validate_school_access, log_rbac_violation
-from core.permissions import check_plan_limits
-from schemas.data_models import TeacherBase, TeacherCreate
+from core.dependencies import get_current_user, get_admin_client, db, run_query, run_query_with_retry, select_columns, returning, fetch_page
+from core.cache import invalidate_profile
+from core.rbac import admin_required, teacher_or_admin_required, require_permission, require_same_school, log_rbac_violation
+from core.permissions import check_plan_limits, record_usage_change
+from schemas.data_models import SafeBaseModel, TeacherBase, TeacherCreate, TeacherPage, TeacherUpdate
 
 router = APIRouter(
     prefix="/api/teachers",
@@ -15,7 +16,7 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=TeacherBase, status_code=status.HTTP_201_CREATED)
-def create_teacher(
+async def create_teacher(
     teacher: TeacherCreate,
     admin_user: dict = Depends(admin_required),
     _: dict = Depends(check_plan_limits("teachers"))
@@ -25,30 +26,37 @@ def create_teacher(
     Plan limits are enforced - free plan limited to 5 teachers, pro to 50, enterprise unlimited.
     """
     # Ensure teacher is created in admin's school
-    teacher_data = teacher.dict()
+    teacher_data = teacher.model_dump(mode='json')
     teacher_data['school_id'] = admin_user['school_id']
     teacher_data['user_id'] = admin_user['id']
 
-    response = supabase.table('teachers').insert(teacher_data).execute()
+    response = await run_query(returning(db.table('teachers').insert(teacher_data), select_columns(TeacherBase)))
     if not response.data:
         raise HTTPException(status_code=400, detail="Failed to create teacher.")
+    await record_usage_change(teacher_data['user_id'], 'teachers', 1)
     return response.data[0]
 
-@router.get("/", response_model=List[TeacherBase])
-def list_teachers(user: dict = Depends(teacher_or_admin_required)):
+@router.get("/", response_model=TeacherPage)
+async def list_teachers(
+    cursor: Optional[UUID] = None,
+    limit: int = Query(50, ge=1, le=100),
+    user: dict = Depends(teacher_or_admin_required)
+):
     """
-    List teachers in the same school as the current user.
+    List teachers in the same school as the current user, one page at a time.
+    Pass the returned next_cursor to get the following page; it is null on the last page.
     """
     # Teachers and admins can only see teachers from their own school
-    response = supabase.table('teachers').select("*").eq('school_id', user['school_id']).execute()
-    return response.data
+    query = db.table('teachers').select(f"id,{select_columns(TeacherBase)}").eq('school_id', user['school_id'])
+    # Validated, and so sanitized, through TeacherPage: teacher names are free text the frontend renders
+    return await fetch_page(query, str(cursor) if cursor else None, limit)
 
-class TeacherCreateByAdmin(BaseModel):
+class TeacherCreateByAdmin(SafeBaseModel):
     name: str
     email: EmailStr
 
 @router.post("/add")
-def add_teacher_by_admin(
+async def add_teacher_by_admin(
     teacher_data: TeacherCreateByAdmin,
     admin_user: dict = Depends(admin_required)
 ):
@@ -64,43 +72,42 @@ def add_teacher_by_admin(
         raise HTTPException(status_code=403, detail="Admin is not associated with a school.")
 
     # 2. Create the user in Supabase Auth (Requires Service Role Key)
-    # Note: In a real app, instantiate a separate admin client with the service role key
-    service_role_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
-    supabase_url = os.environ.get("SUPABASE_URL")
-
-    if not service_role_key:
+    try:
+        admin_client = get_admin_client()
+    except RuntimeError:
         raise HTTPException(status_code=500, detail="Server misconfiguration: Missing Service Role Key.")
 
-    from supabase import create_client
-    admin_client = create_client(supabase_url, service_role_key)
-
     try:
         # Create user with a dummy password that they must reset, or use magic link flow
         # Supabase 'invite_user_by_email' is preferred if SMTP is set up
-        auth_response = admin_client.auth.admin.invite_user_by_email(teacher_data.email)
+        auth_response = await run_in_threadpool(admin_client.auth.admin.invite_user_by_email, teacher_data.email)
         new_user = auth_response.user
 
         if not new_user:
              raise HTTPException(status_code=400, detail="Failed to create auth user.")
 
-        # 3. Create profile record
-        supabase.table('profiles').insert({
-            'id': new_user.id,
-            'name': teacher_data.name,
-            'email': teacher_data.email,
-            'role': 'teacher',
-            'school_id': school_id
-        }).execute()
-
-        # 4. Create teacher record
-        supabase.table('teachers').insert({
-            'user_id': new_user.id,
-            'school_id': school_id
-        }).execute()
+        # 3. Create the profile and teacher records in one transaction
+        try:
+            # Not idempotent: only errors raised before the transaction ran are retried
+            await run_query_with_retry(db.rpc('add_teacher', {
+                'p_user_id': new_user.id,
+                'p_name': teacher_data.name,
+                'p_email': teacher_data.email,
+                'p_school_id': school_id
+            }))
+        except Exception:
+            # The transaction rolled back; remove the invited auth user so the email can be retried
+            try:
+                await run_in_threadpool(admin_client.auth.admin.delete_user, new_user.id)
+            except Exception:
+                pass  # Best effort cleanup
+            raise
+        await invalidate_profile(new_user.id)
 
     except Exception as e:
         # Log the security event
-        log_rbac_violation(
+        await run_in_threadpool(
+            log_rbac_violation,
             admin_user['id'],
             "create_teacher_failed",
             teacher_data.email,
@@ -111,72 +118,74 @@ def add_teacher_by_admin(
     return {"message": f"Teacher '{teacher_data.name}' created. Invitation email sent."}
 
 @router.get("/{teacher_id}")
-def get_teacher(teacher_id: str, user: dict = Depends(teacher_or_admin_required)):
+async def get_teacher(teacher_id: str, user: dict = Depends(teacher_or_admin_required)):
     """
     Get a specific teacher. Must be in same school.
     """
-    teacher = supabase.table('teachers').select("*").eq('id', teacher_id).single().execute().data
-    if not teacher:
+    require_same_school(user)
+
+    # The school filter enforces access in the same query; other schools' teachers read as not found
+    response = await run_query(
+        db.table('teachers').select("*")
+        .eq('id', teacher_id).eq('school_id', user['school_id'])
+        .maybe_single()
+    )
+    if not response or not response.data:
         raise HTTPException(status_code=404, detail="Teacher not found")
 
-    # Verify same school access
-    validate_school_access(user, teacher['school_id'])
-
-    return teacher
+    return response.data
 
 @router.delete("/{teacher_id}")
-def delete_teacher(teacher_id: str, admin_user: dict = Depends(admin_required)):
+async def delete_teacher(teacher_id: str, admin_user: dict = Depends(admin_required)):
     """
     Delete a teacher. Admin only, same school only.
     """
     require_permission(admin_user, "delete_teacher")
-
-    # Get teacher to verify school
-    teacher = supabase.table('teachers').select("*").eq('id', teacher_id).single().execute().data
-    if not teacher:
+    require_same_school(admin_user)
+
+    # Delete only within the admin's school; an empty result means not found or another school
+    result = await run_query(returning(
+        db.table('teachers').delete()
+        .eq('id', teacher_id).eq('school_id', admin_user['school_id']),
+        "id, user_id"
+    ))
+    if not result.data:
         raise HTTPException(status_code=404, detail="Teacher not found")
 
-    # Verify same school
-    validate_school_access(admin_user, teacher['school_id'])
-
-    # Delete teacher
-    result = supabase.table('teachers').delete().eq('id', teacher_id).execute()
-    if not result.data:
-        raise HTTPException(status_code=400, detail="Failed to delete teacher")
+    teacher = result.data[0]
+    if teacher.get('user_id'):
+        await record_usage_change(teacher['user_id'], 'teachers', -1)
 
     return {"message": "Teacher deleted successfully"}
 
 @router.patch("/{teacher_id}")
-def update_teacher(
+async def update_teacher(
     teacher_id: str,
-    updates: dict,
+    updates: TeacherUpdate,
     user: dict = Depends(teacher_or_admin_required)
 ):
     """
     Update teacher information. Admins can update any teacher in their school.
     Teachers can only update their own profile.
     """
-    # Get teacher
-    teacher = supabase.table('teachers').select("*").eq('id', teacher_id).single().execute().data
-    if not teacher:
-        raise HTTPException(status_code=404, detail="Teacher not found")
-
-    # Verify access
-    validate_school_access(user, teacher['school_id'])
-
-    # Additional check: teachers can only edit their own profile
-    if user['role'] == 'teacher' and teacher['user_id'] != user['id']:
-        log_rbac_violation(
-            user['id'],
-            "unauthorized_teacher_update",
-            teacher_id,
-            "Teacher tried to update another teacher's profile"
-        )
-        raise HTTPException(status_code=403, detail="Teachers can only update their own profile")
-
-    # Update teacher
-    result = supabase.table('teachers').update(updates).eq('id', teacher_id).execute()
+    require_same_school(user)
+
+    # Only the fields the client actually sent, and only those TeacherUpdate allows
+    changes = updates.model_dump(mode='json', exclude_unset=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="No updatable fields provided.")
+
+    # Access rules go into the filter so the check and the write are one statement
+    query = (
+        db.table('teachers').update(changes)
+        .eq('id', teacher_id).eq('school_id', user['school_id'])
+    )
+    if user['role'] == 'teacher':
+        # Teachers can only edit their own profile
+        query = query.eq('user_id', user['id'])
+
+    result = await run_query(query)
     if not result.data:
-        raise HTTPException(status_code=400, detail="Failed to update teacher")
+        raise HTTPException(status_code=404, detail="Teacher not found")
 
     return result.data[0]
@@ -1,142 +1,131 @@
-import asyncio
+import hashlib
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from core.dependencies import get_current_user, supabase
-from services.scheduler import TimetableScheduler
-from services.ai_orchestrator import extract_metrics, rank_candidates_with_gemini, explain_candidate_with_gpt
 import uuid
-import concurrent.futures
+import orjson
+from celery.result import AsyncResult
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from core.dependencies import get_current_user, db, run_query, fetch_page
+from core.cache import invalidate_public_timetables, cached_supabase_request, redis_client
+from core.rate_limit import limiter
+from services.ai_orchestrator import rank_candidates_with_gemini, explain_candidate_with_gpt
+from services.celery_app import celery_app
+from services.scheduler_tasks import solve_and_persist
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/timetables", tags=["Timetables"], dependencies=[Depends(get_current_user)])
 
-# Initialize rate limiter for this router
-limiter = Limiter(key_func=get_remote_address)
+# AI rankings/explanations are deterministic enough to reuse for a day
+AI_RESULT_TTL = 86400
 
-# Create a thread pool for heavy calculations
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=3)
+# Celery states reported to clients while a generation job is unfinished
+JOB_STATUS = {"PENDING": "queued", "RECEIVED": "queued", "STARTED": "running", "RETRY": "running"}
+# Job owners are kept as long as Celery keeps the job's result (result_expires, a day by default)
+GENERATION_JOB_TTL = 86400
 
-def run_solver(teachers_data, rooms_data, subjects_data, classes_data, teacher_subjects_data):
-    """Helper function to run solver synchronously"""
-    logger.info(f"Running solver with {len(teachers_data)} teachers, {len(classes_data)} classes")
-    scheduler = TimetableScheduler(teachers_data, rooms_data, subjects_data, classes_data, teacher_subjects_data)
-    solutions = scheduler.solve(solution_limit=5)
-    logger.info(f"Solver completed, found {len(solutions)} solutions")
-    return solutions
+def _job_owner_key(job_id: str) -> str:
+    return f"generation_job:{job_id}:owner"
 
 @router.post("/generate", status_code=status.HTTP_202_ACCEPTED)
 @limiter.limit("5/hour")
-async def generate_timetable(request: Request):
-    # 1. Fetch data (IO bound, okay to await)
-    teachers = supabase.table('teachers').select("*").execute().data
-    rooms = supabase.table('rooms').select("*").execute().data
-    subjects = supabase.table('subjects').select("*").execute().data
-    classes = supabase.table('classes').select("*").execute().data
-    # You might need a join table for teacher_subjects in your schema
-    teacher_subjects = []  # Placeholder: fetch this from your relation table
-
-    if not teachers or not classes:
-        raise HTTPException(status_code=400, detail="Insufficient data to generate timetable.")
-
-    # 2. Run solver in background thread (CPU bound) - NO DATABASE CHANGES YET
-    loop = asyncio.get_event_loop()
-    try:
-        solutions = await loop.run_in_executor(
-            executor,
-            run_solver,
-            teachers, rooms, subjects, classes, teacher_subjects
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Solver error: {str(e)}")
-
-    if not solutions:
-        raise HTTPException(status_code=500, detail="Could not find any valid solutions.")
-
-    # 3. ONLY NOW create database records (transactional integrity)
-    try:
-        # Create timetable only after successful generation
-        new_timetable = supabase.table('timetables').insert({"term": "Fall 2025"}).execute().data[0]
-
-        for solution in solutions:
-            candidate_id = str(uuid.uuid4())
-            metrics = extract_metrics(solution, teachers)
-
-            # Create candidate record
-            candidate_result = supabase.table('candidates').insert({
-                "id": candidate_id,
-                "timetable_id": new_timetable['id'],
-                "metrics": metrics
-            }).execute()
-
-            if not candidate_result.data:
-                raise Exception(f"Failed to create candidate {candidate_id}")
-
-            # Create assignment records
-            assignments_with_ids = []
-            for assignment in solution:
-                assignment_copy = assignment.copy()
-                assignment_copy['candidate_id'] = candidate_id
-                assignment_copy['timetable_id'] = new_timetable['id']
-                assignments_with_ids.append(assignment_copy)
-
-            assignment_result = supabase.table('assignments').insert(assignments_with_ids).execute()
-            if not assignment_result.data:
-                raise Exception(f"Failed to create assignments for candidate {candidate_id}")
-
-        return {"message": f"{len(solutions)} candidates generated.", "timetable_id": new_timetable['id']}
-
-    except Exception as e:
-        # If database operations fail, clean up any partial data
-        if 'new_timetable' in locals():
-            try:
-                # Delete the timetable and cascade will handle candidates/assignments
-                supabase.table('timetables').delete().eq('id', new_timetable['id']).execute()
-            except:
-                pass  # Best effort cleanup
-
-        raise HTTPException(status_code=500, detail=f"Database error during timetable creation: {str(e)}")
+async def generate_timetable(request: Request, current_user: dict = Depends(get_current_user)):
+    """
+    Queue timetable generation on the Celery workers and return immediately.
+    Poll GET /api/timetables/jobs/{job_id} for the outcome.
+    """
+    # The owner is recorded before the job is queued, so it's there by the first poll
+    job_id = str(uuid.uuid4())
+    await redis_client.set(_job_owner_key(job_id), current_user.id, ex=GENERATION_JOB_TTL)
+    await run_in_threadpool(solve_and_persist.apply_async, task_id=job_id)
+    return {"job_id": job_id, "status": "queued"}
+
+@router.get("/jobs/{job_id}")
+async def get_generation_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Status of a queued generation; includes the timetable_id once it has succeeded."""
+    # Someone else's job reads the same as one that doesn't exist
+    if await redis_client.get(_job_owner_key(job_id)) != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job = AsyncResult(job_id, app=celery_app)
+    state = await run_in_threadpool(lambda: job.state)
+
+    if state == "SUCCESS":
+        result = job.result if isinstance(job.result, dict) else {}
+        return {
+            "job_id": job_id,
+            "status": "completed",
+            "message": result.get("message"),
+            "timetable_id": result.get("timetable_id"),
+        }
+    if state == "FAILURE":
+        # The worker's exception text stays in the logs, not in the response
+        logger.error(f"Timetable generation job {job_id} failed: {job.result!r}")
+        return {"job_id": job_id, "status": "failed", "detail": "Timetable generation failed."}
+    return {"job_id": job_id, "status": JOB_STATUS.get(state, "queued")}
 
 @router.get("/")
-async def get_timetables():
-    """Get all timetables"""
-    response = supabase.table('timetables').select("*").execute()
-    return response.data
+async def get_timetables(cursor: Optional[uuid.UUID] = None, limit: int = Query(50, ge=1, le=100)):
+    """Get timetables one page at a time; pass the returned next_cursor for the next page"""
+    return ORJSONResponse(await fetch_page(db.table('timetables').select("*"), str(cursor) if cursor else None, limit))
 
 @router.get("/{timetable_id}")
 async def get_timetable(timetable_id: str):
     """Get specific timetable with its candidates"""
-    timetable = supabase.table('timetables').select("*").eq('id', timetable_id).single().execute()
-    if not timetable.data:
+    timetable = await run_query(db.table('timetables').select("*").eq('id', timetable_id).maybe_single())
+    if not timetable or not timetable.data:
         raise HTTPException(status_code=404, detail="Timetable not found")
 
-    candidates = supabase.table('candidates').select("*").eq('timetable_id', timetable_id).execute()
+    candidates = await run_query(db.table('candidates').select("*").eq('timetable_id', timetable_id))
 
-    return {
+    # Returned as-is: skips jsonable_encoder's walk over every candidate's metrics
+    return ORJSONResponse({
         "timetable": timetable.data,
         "candidates": candidates.data
-    }
+    })
+
+def _content_key(prefix: str, payload) -> str:
+    """Cache key for an AI result, derived from exactly the data sent to the model."""
+    digest = hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    return f"{prefix}:{digest}"
 
 @router.post("/{timetable_id}/rank")
 async def rank_candidates(timetable_id: str):
     """Rank candidates using AI"""
-    candidates = supabase.table('candidates').select("*").eq('timetable_id', timetable_id).execute().data
+    candidates = (await run_query(
+        db.table('candidates').select("id, metrics").eq('timetable_id', timetable_id).order('id')
+    )).data
 
     if not candidates:
         raise HTTPException(status_code=404, detail="No candidates found for this timetable")
 
-    try:
-        rankings = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            rank_candidates_with_gemini,
-            candidates
-        )
+    async def ask_gemini():
+        result = await rank_candidates_with_gemini(candidates)
+        # Anything but {"ranking": [...]} comes back as None, which isn't cached, so the next call asks again
+        if isinstance(result, dict) and isinstance(result.get("ranking"), list):
+            return result
+        logger.warning(f"Unusable ranking from Gemini for timetable {timetable_id}: {result!r}")
+        return None
 
-        # Update candidates with rankings
-        for candidate, rank in zip(candidates, rankings):
-            supabase.table('candidates').update({"rank": rank}).eq('id', candidate['id']).execute()
+    try:
+        # Identical candidate metrics get the same ranking; skip the model call on a repeat
+        result = await cached_supabase_request(_content_key("ranking", candidates), ask_gemini, AI_RESULT_TTL)
+        if result is None:
+            raise ValueError("Model returned no ranking")
+        rankings = result["ranking"]
+
+        # All rankings in one UPDATE; ids the model made up (or since deleted) match no row
+        candidate_ids = {c['id'] for c in candidates}
+        await run_query(db.rpc('update_candidate_ranks', {
+            'p_timetable_id': timetable_id,
+            'p_ranks': {
+                candidate_id: position
+                for position, candidate_id in enumerate(rankings, start=1)
+                if candidate_id in candidate_ids
+            },
+        }))
 
         return {"message": "Candidates ranked successfully", "rankings": rankings}
     except Exception as e:
@@ -145,19 +134,18 @@ async def rank_candidates(timetable_id: str):
 @router.get("/{timetable_id}/candidates/{candidate_id}/explain")
 async def explain_candidate(timetable_id: str, candidate_id: str):
     """Get AI explanation for a specific candidate"""
-    candidate = supabase.table('candidates').select("*").eq('id', candidate_id).single().execute()
-    if not candidate.data:
+    candidate = await run_query(db.table('candidates').select("metrics").eq('id', candidate_id).maybe_single())
+    if not candidate or not candidate.data:
         raise HTTPException(status_code=404, detail="Candidate not found")
 
-    assignments = supabase.table('assignments').select("*").eq('candidate_id', candidate_id).execute()
+    metrics = candidate.data['metrics']
+
+    async def ask_gpt():
+        return await explain_candidate_with_gpt(metrics)
 
     try:
-        explanation = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            explain_candidate_with_gpt,
-            candidate.data,
-            assignments.data
-        )
+        # The explanation depends only on the metrics, so equal metrics share one cached answer
+        explanation = await cached_supabase_request(_content_key("explanation", metrics), ask_gpt, AI_RESULT_TTL)
 
         return {"explanation": explanation}
     except Exception as e:
@@ -166,14 +154,11 @@ async def explain_candidate(timetable_id: str, candidate_id: str):
 @router.delete("/{timetable_id}")
 async def delete_timetable(timetable_id: str):
     """Delete timetable and all associated data"""
-    # Delete assignments first (foreign key constraint)
-    supabase.table('assignments').delete().eq('timetable_id', timetable_id).execute()
-    # Delete candidates
-    supabase.table('candidates').delete().eq('timetable_id', timetable_id).execute()
-    # Delete timetable
-    result = supabase.table('timetables').delete().eq('id', timetable_id).execute()
+    # One atomic round-trip; candidates and assignments are removed by ON DELETE CASCADE
+    result = await run_query(db.rpc('delete_timetable_cascade', {'p_timetable_id': timetable_id}))
 
     if not result.data:
         raise HTTPException(status_code=404, detail="Timetable not found")
 
+    await invalidate_public_timetables()
     return {"message": "Timetable deleted successfully"}
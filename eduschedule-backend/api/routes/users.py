@@ -1,30 +1,72 @@
 # api/routes/users.py
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import Optional
+from uuid import UUID
 import secrets
+import time
 import hashlib
+from functools import lru_cache
 from datetime import datetime, timezone
-from core.dependencies import get_current_user, supabase
+from postgrest.types import ReturnMethod
+from core.config import get_settings
+from core.dependencies import get_current_user, db, run_query, returning, fetch_page
+from core.cache import api_key_cache, invalidate_profile, record_api_key_use
+from core.loaders import get_profile_cached
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/users", tags=["Users"])
 
+API_KEY_PREFIX = get_settings().API_KEY_PREFIX
+
+# Seconds the browser may reuse a deal-status answer
+DEAL_STATUS_MAX_AGE = 30
+
+# Profile fields returned by GET /me unless the caller asks for others
+PROFILE_PUBLIC_FIELDS = ("id", "name", "email", "role", "school_id", "plan", "deal_expires_at", "updated_at")
+
+def _bytea(digest: bytes) -> str:
+    """A digest in the \\x-hex text form PostgREST uses for bytea values, both ways"""
+    return "\\x" + digest.hex()
+
 def hash_api_key(api_key: str) -> str:
-    """Hash an API key using SHA256"""
-    return hashlib.sha256(api_key.encode()).hexdigest()
+    """Hash an API key using BLAKE2b-256"""
+    return _bytea(hashlib.blake2b(api_key.encode('ascii'), digest_size=32).digest())
+
+def legacy_hash_api_key(api_key: str) -> str:
+    """SHA256 hash stored for keys created before the switch to BLAKE2b"""
+    return _bytea(hashlib.sha256(api_key.encode('ascii')).digest())
+
+@lru_cache(maxsize=1024)
+def deal_expiry_timestamp(expires_at: Optional[str]) -> float:
+    """
+    Unix time at which a deal_expires_at value lapses; 0.0 if unset or unparseable.
+    Cached, so each distinct expiry string is parsed once rather than per request.
+    """
+    if not expires_at:
+        return 0.0
+    try:
+        # fromisoformat is C-implemented and accepts a trailing 'Z' on Python 3.11+
+        parsed = datetime.fromisoformat(expires_at)
+    except (ValueError, TypeError) as e:
+        logger.error(f"Error parsing deal expiry date {expires_at!r}: {str(e)}")
+        return 0.0
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
 
 @router.get("/", dependencies=[Depends(get_current_user)])
-def list_users():
+async def list_users(cursor: Optional[UUID] = None, limit: int = Query(50, ge=1, le=100)):
     """
-    Retrieves a list of all users from profiles table.
+    Retrieves users from the profiles table, one page at a time.
+    Pass the returned next_cursor to get the following page; it is null on the last page.
     """
-    response = supabase.table('profiles').select("id, name, email, role, school_id").execute()
-    return response.data
+    return await fetch_page(db.table('profiles').select("id, name, email, role, school_id"), str(cursor) if cursor else None, limit)
 
 @router.post("/me/apikeys")
-def create_api_key_for_user(current_user: dict = Depends(get_current_user)):
+async def create_api_key_for_user(current_user: dict = Depends(get_current_user)):
     """
     Generates a new API key for the currently authenticated user.
     SECURITY: Only stores the hash of the key in database.
@@ -32,24 +74,24 @@ def create_api_key_for_user(current_user: dict = Depends(get_current_user)):
     user_id = current_user.id
 
     # Generate a new secure, URL-safe key
-    new_key = f"edusk_{secrets.token_urlsafe(32)}"
+    random_part = secrets.token_urlsafe(32)
+    new_key = API_KEY_PREFIX + random_part
     key_hash = hash_api_key(new_key)
 
-    # Generate a readable name for the key (first 8 chars for identification)
-    key_preview = f"...{new_key[-8:]}"
+    # Generate a readable name for the key (last 8 chars for identification)
+    key_preview = "..." + random_part[-8:]
 
     key_data = {
         "user_id": user_id,
         "key_hash": key_hash,  # Store only the hash
         "key_preview": key_preview,  # For user to identify their keys
         "description": "Default API Key",
-        "created_at": datetime.utcnow().isoformat(),
-        "last_used": None,
         "is_active": True
+        # created_at and last_used come from the column defaults
     }
 
     try:
-        db_response = supabase.table('api_keys').insert(key_data).execute()
+        db_response = await run_query(returning(db.table('api_keys').insert(key_data), "id"))
 
         if not db_response.data:
             logger.error(f"Failed to create API key for user {user_id}")
@@ -68,85 +110,91 @@ def create_api_key_for_user(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Failed to create API key")
 
 @router.get("/me/apikeys")
-def list_my_api_keys(current_user: dict = Depends(get_current_user)):
+async def list_my_api_keys(current_user: dict = Depends(get_current_user)):
     """
     List all API keys for the current user (without showing the actual keys).
     """
     user_id = current_user.id
 
-    response = supabase.table('api_keys').select(
+    response = await run_query(db.table('api_keys').select(
         "id, key_preview, description, created_at, last_used, is_active"
-    ).eq('user_id', user_id).execute()
+    ).eq('user_id', user_id))
 
     return response.data
 
 @router.delete("/me/apikeys/{key_id}")
-def delete_api_key(key_id: str, current_user: dict = Depends(get_current_user)):
+async def delete_api_key(key_id: str, current_user: dict = Depends(get_current_user)):
     """
     Delete a specific API key for the current user.
     """
     user_id = current_user.id
 
-    # Verify the key belongs to the current user
-    key_response = supabase.table('api_keys').select("user_id").eq('id', key_id).single().execute()
+    # Ownership is part of the DELETE filter; another user's key reads as not found
+    delete_response = await run_query(returning(
+        db.table('api_keys').delete().eq('id', key_id).eq('user_id', user_id),
+        "key_hash"
+    ))
 
-    if not key_response.data:
+    if not delete_response.data:
         raise HTTPException(status_code=404, detail="API key not found")
 
-    if key_response.data['user_id'] != user_id:
-        logger.warning(f"User {user_id} attempted to delete API key {key_id} belonging to another user")
-        raise HTTPException(status_code=403, detail="Access denied")
-
-    # Delete the key
-    delete_response = supabase.table('api_keys').delete().eq('id', key_id).execute()
-
-    if not delete_response.data:
-        raise HTTPException(status_code=500, detail="Failed to delete API key")
+    # Other workers drop their cached lookup when API_KEY_CACHE_TTL expires
+    api_key_cache.pop(delete_response.data[0]['key_hash'])
 
     logger.info(f"API key {key_id} deleted by user {user_id}")
     return {"message": "API key deleted successfully"}
 
 @router.get("/me/deal-status")
-def get_user_deal_status(current_user: dict = Depends(get_current_user)):
+async def get_user_deal_status(response: Response, current_user: dict = Depends(get_current_user)):
     """
     Checks if the current user has an active special deal.
+    The browser may reuse the answer briefly, but never past the deal's expiry.
     """
-    user_id = current_user.id
-    response = supabase.table('profiles').select("deal_expires_at").eq('id', user_id).single().execute()
+    profile = await get_profile_cached(current_user.id)
+    expires_in = int(deal_expiry_timestamp(profile.get('deal_expires_at') if profile else None) - time.time())
 
-    if response.data and response.data.get('deal_expires_at'):
-        expires_at_str = response.data['deal_expires_at']
-        try:
-            # Handle timezone-aware datetime parsing
-            expires_at = datetime.fromisoformat(expires_at_str.replace('Z', '+00:00'))
-            now = datetime.now(timezone.utc)
-
-            if expires_at > now:
-                expires_in_seconds = (expires_at - now).total_seconds()
-                return {"isActive": True, "expiresIn": int(expires_in_seconds)}
-        except (ValueError, AttributeError) as e:
-            logger.error(f"Error parsing deal expiry date for user {user_id}: {str(e)}")
+    if expires_in > 0:
+        response.headers["Cache-Control"] = f"private, max-age={min(DEAL_STATUS_MAX_AGE, expires_in)}"
+        return {"isActive": True, "expiresIn": expires_in}
 
+    response.headers["Cache-Control"] = f"private, max-age={DEAL_STATUS_MAX_AGE}"
     return {"isActive": False, "expiresIn": 0}
 
 @router.get("/me")
-def get_my_user_profile(current_user: dict = Depends(get_current_user)):
+async def get_my_user_profile(
+    request: Request,
+    fields: Optional[str] = Query(None, description="Comma-separated profile fields, or * for the full row"),
+    current_user: dict = Depends(get_current_user)
+):
     """
-    Fetches the full profile for the currently logged-in user.
+    Fetches the profile for the currently logged-in user.
+    Carries an ETag, so a revalidating client gets a bodiless 304 when nothing changed.
     """
     user_id = current_user.id
-    logger.info(f"Fetching profile for user: {user_id}")
+    logger.debug("Fetching profile for user: %s", user_id)
 
-    response = supabase.table('profiles').select("*").eq('id', user_id).single().execute()
+    profile = await get_profile_cached(user_id)
 
-    if not response.data:
+    if not profile:
         logger.warning(f"Profile not found for user {user_id}")
         raise HTTPException(status_code=404, detail="User profile not found.")
 
-    return response.data
+    # The cached row is the full profile (it also serves RBAC and plan checks),
+    # so the projection happens here rather than in the select
+    if fields != "*":
+        wanted = fields.split(",") if fields else PROFILE_PUBLIC_FIELDS
+        profile = {field: profile[field] for field in wanted if field in profile}
+
+    body = orjson.dumps(profile)
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    # no-cache: always revalidate, since profile edits must show up immediately
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.patch("/me")
-def update_my_profile(updates: dict, current_user: dict = Depends(get_current_user)):
+async def update_my_profile(updates: dict, current_user: dict = Depends(get_current_user)):
     """
     Update the current user's profile. Users can only update specific fields.
     """
@@ -161,55 +209,64 @@ def update_my_profile(updates: dict, current_user: dict = Depends(get_current_us
     if not filtered_updates:
         raise HTTPException(status_code=400, detail="No valid fields to update")
 
-    # Add timestamp
-    filtered_updates['updated_at'] = datetime.utcnow().isoformat()
+    # updated_at is set by the profiles_set_updated_at trigger
 
     try:
-        response = supabase.table('profiles').update(filtered_updates).eq('id', user_id).execute()
+        response = await run_query(db.table('profiles').update(filtered_updates).eq('id', user_id))
 
         if not response.data:
             raise HTTPException(status_code=400, detail="Failed to update profile")
 
+        await invalidate_profile(user_id)
         logger.info(f"Profile updated for user {user_id}")
         return response.data[0]
     except Exception as e:
         logger.error(f"Error updating profile for user {user_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to update profile")
 
-def verify_api_key(api_key: str) -> dict:
+async def verify_api_key(api_key: str) -> dict:
     """
     Verify an API key by checking its hash against the database.
     Returns user info if valid, raises HTTPException if invalid.
     This function can be used by other routes for API key authentication.
+    Key lookups are cached briefly per worker (see API_KEY_CACHE_TTL).
     """
-    if not api_key.startswith("edusk_"):
+    if not api_key.startswith(API_KEY_PREFIX):
         raise HTTPException(status_code=401, detail="Invalid API key format")
 
     key_hash = hash_api_key(api_key)
 
-    # Find the key in database
-    key_response = supabase.table('api_keys').select(
-        "user_id, is_active, last_used"
-    ).eq('key_hash', key_hash).single().execute()
+    cached = api_key_cache.get(key_hash)
+    if cached is None:
+        # Find the key in database, under either hash (older keys are stored as SHA256)
+        key_response = await run_query(db.table('api_keys').select(
+            "user_id, is_active, key_hash"
+        ).in_('key_hash', [key_hash, legacy_hash_api_key(api_key)]).maybe_single())
+
+        if not key_response or not key_response.data:
+            logger.warning(f"Invalid API key attempt: {api_key[:20]}...")
+            raise HTTPException(status_code=401, detail="Invalid API key")
 
-    if not key_response.data:
-        logger.warning(f"Invalid API key attempt: {api_key[:20]}...")
-        raise HTTPException(status_code=401, detail="Invalid API key")
+        cached = (key_response.data['user_id'], key_response.data['is_active'])
+        api_key_cache.set(key_hash, cached)
 
-    key_data = key_response.data
+        if key_response.data['key_hash'] != key_hash:
+            # Legacy SHA256 row: store the BLAKE2b hash so later uses match directly
+            await run_query(db.table('api_keys').update(
+                {'key_hash': key_hash}, returning=ReturnMethod.minimal
+            ).eq('key_hash', key_response.data['key_hash']))
 
-    if not key_data['is_active']:
+    user_id, is_active = cached
+    if not is_active:
         raise HTTPException(status_code=401, detail="API key is deactivated")
 
-    # Update last used timestamp
-    supabase.table('api_keys').update({
-        'last_used': datetime.utcnow().isoformat()
-    }).eq('key_hash', key_hash).execute()
+    # last_used is written in batches by a Celery beat task, not per request
+    await record_api_key_use(key_hash, time.time())
 
     # Get user profile
-    user_response = supabase.table('profiles').select("*").eq('id', key_data['user_id']).single().execute()
+    profile = await get_profile_cached(user_id)
 
-    if not user_response.data:
+    if not profile:
         raise HTTPException(status_code=401, detail="User not found for API key")
 
-    return user_response.data
+    return profile
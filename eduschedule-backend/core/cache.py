@@ -0,0 +1,167 @@
+# eduschedule-backend/core/cache.py
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Hashable, Optional
+import orjson
+from cachetools import TTLCache
+import redis
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+from core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Profiles change rarely (role, school, plan); writers call invalidate_profile
+PROFILE_CACHE_TTL = 60
+# The in-process copy can't be invalidated from other workers, so it lives shorter
+PROFILE_LOCAL_TTL = 15
+# A deleted or deactivated API key keeps working on other workers for at most this long
+API_KEY_CACHE_TTL = min(get_settings().CACHE_TTL, 60)
+
+
+class TTLStore:
+    """
+    Thread-safe TTL + LRU cache for small, read-heavy lookups.
+    Entries live in process memory, so each worker keeps its own copy and
+    invalidation only reaches the worker that performed the write; keep TTLs short.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._cache.get(key, default)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._cache[key] = value
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            return self._cache.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+# Public (unauthenticated) timetable pages as serialized JSON, keyed by (version, cursor, limit)
+public_timetable_cache = TTLStore(maxsize=512, ttl=30)
+
+# Full profile rows keyed by user_id; in front of the Redis profile:{user_id} entries
+profile_cache = TTLStore(maxsize=10_000, ttl=PROFILE_LOCAL_TTL)
+
+# API key lookups keyed by key_hash: (user_id, is_active)
+api_key_cache = TTLStore(maxsize=get_settings().CACHE_MAX_ENTRIES, ttl=API_KEY_CACHE_TTL)
+
+# Shared across workers; use for state that must agree between processes
+# (e.g. webhook idempotency). Connections are opened lazily on first use.
+redis_client = aioredis.from_url(get_settings().REDIS_URL, decode_responses=True)
+# Blocking twin for code that runs off the event loop (sync helpers, Celery tasks)
+redis_sync_client = redis.Redis.from_url(get_settings().REDIS_URL, decode_responses=True)
+
+
+async def cached_supabase_request(key: str, fetcher: Callable[[], Awaitable[Any]], ttl: int) -> Any:
+    """
+    Read-through cache in Redis for a JSON-serializable fetch result.
+    None results are not cached, and Redis errors fall back to calling the fetcher.
+    """
+    try:
+        cached = await redis_client.get(key)
+        if cached is not None:
+            return orjson.loads(cached)
+    except RedisError as e:
+        logger.warning(f"Cache read failed for {key}: {e}")
+
+    value = await fetcher()
+    if value is not None:
+        try:
+            await redis_client.set(key, orjson.dumps(value), ex=ttl)
+        except RedisError as e:
+            logger.warning(f"Cache write failed for {key}: {e}")
+    return value
+
+
+# Redis hash of key_hash -> last use (Unix time), flushed to api_keys by
+# services.api_key_tasks.flush_api_key_usage
+API_KEY_USAGE_KEY = "api_keys:last_used"
+
+
+async def record_api_key_use(key_hash: str, used_at: float) -> None:
+    """Note an API key use for the next batched last_used write; best effort."""
+    try:
+        await redis_client.hset(API_KEY_USAGE_KEY, key_hash, used_at)
+    except RedisError as e:
+        logger.warning(f"API key usage not recorded: {e}")
+
+
+# Redis list of security_log rows (JSON) awaiting services.audit_tasks.flush_security_log
+SECURITY_LOG_KEY = "security_log:pending"
+# Beyond this the oldest pending rows are dropped, so a flood of denials can't grow Redis unbounded
+SECURITY_LOG_MAX_PENDING = 10000
+
+
+def queue_security_event(row: dict) -> None:
+    """Queue a security_log row for the next batched insert; best effort."""
+    try:
+        pipe = redis_sync_client.pipeline(transaction=False)
+        pipe.rpush(SECURITY_LOG_KEY, orjson.dumps(row))
+        pipe.ltrim(SECURITY_LOG_KEY, -SECURITY_LOG_MAX_PENDING, -1)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Security event not queued: {e}")
+
+
+# Bumped whenever timetables change; part of every public page's cache key, so one
+# INCR (from the API or a Celery worker) retires the cached pages on every process
+PUBLIC_TIMETABLES_VERSION_KEY = "public_timetables:version"
+
+
+async def public_timetables_version() -> Optional[str]:
+    """Current version of the public timetable pages; None if Redis is unreachable (TTL still applies)."""
+    try:
+        return await redis_client.get(PUBLIC_TIMETABLES_VERSION_KEY)
+    except RedisError as e:
+        logger.warning(f"Public timetable version read failed: {e}")
+        return None
+
+
+async def invalidate_public_timetables() -> None:
+    """Retire every cached public timetable page; best effort."""
+    public_timetable_cache.clear()
+    try:
+        await redis_client.incr(PUBLIC_TIMETABLES_VERSION_KEY)
+    except RedisError as e:
+        logger.warning(f"Public timetable invalidation failed: {e}")
+
+
+def invalidate_public_timetables_sync() -> None:
+    """invalidate_public_timetables() for Celery tasks, which have no cached pages of their own."""
+    try:
+        redis_sync_client.incr(PUBLIC_TIMETABLES_VERSION_KEY)
+    except RedisError as e:
+        logger.warning(f"Public timetable invalidation failed: {e}")
+
+
+def profile_cache_key(user_id: str) -> str:
+    return f"profile:{user_id}"
+
+
+async def invalidate_profile(user_id: str) -> None:
+    """Drop a cached profile after a write to the profiles row."""
+    profile_cache.pop(user_id)
+    try:
+        await redis_client.delete(profile_cache_key(user_id))
+    except RedisError as e:
+        logger.warning(f"Profile cache invalidation failed for {user_id}: {e}")
+
+
+__all__ = [
+    'TTLStore', 'public_timetable_cache', 'profile_cache', 'api_key_cache', 'redis_client', 'PROFILE_CACHE_TTL',
+    'cached_supabase_request', 'profile_cache_key', 'invalidate_profile',
+    'API_KEY_USAGE_KEY', 'record_api_key_use', 'redis_sync_client',
+    'SECURITY_LOG_KEY', 'queue_security_event',
+    'public_timetables_version', 'invalidate_public_timetables', 'invalidate_public_timetables_sync',
+]
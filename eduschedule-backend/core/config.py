@@ -1,8 +1,13 @@
 # eduschedule-backend/core/config.py
 import os
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
-from functools import lru_cache
-from typing import List, Optional
+from typing import FrozenSet, List, Optional, Tuple, Union
+
+def _split_csv(value) -> List[str]:
+    """Comma-separated string (or list) to its non-empty, stripped items."""
+    items = value.split(",") if isinstance(value, str) else value
+    return [item.strip() for item in items if item.strip()]
 
 class Settings(BaseSettings):
     # Application
@@ -21,14 +26,17 @@ class Settings(BaseSettings):
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
     SUPABASE_SERVICE_ROLE_KEY: str = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
+    SUPABASE_JWT_SECRET: str = os.getenv("SUPABASE_JWT_SECRET", "")
+    JWKS_CACHE_TTL: int = int(os.getenv("JWKS_CACHE_TTL", "3600"))  # 1 hour
 
     # Redis & Celery
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
     CELERY_BROKER_URL: str = os.getenv("CELERY_BROKER_URL", None) or os.getenv("REDIS_URL", "redis://localhost:6379/0")
     CELERY_RESULT_BACKEND: str = os.getenv("CELERY_RESULT_BACKEND", None) or os.getenv("REDIS_URL", "redis://localhost:6379/0")
-    CELERY_TASK_SERIALIZER: str = "json"
-    CELERY_ACCEPT_CONTENT: List[str] = ["json"]
-    CELERY_RESULT_SERIALIZER: str = "json"
+    # msgpack is smaller and faster to encode; json stays accepted for messages queued before the switch
+    CELERY_TASK_SERIALIZER: str = "msgpack"
+    CELERY_ACCEPT_CONTENT: List[str] = ["msgpack", "json"]
+    CELERY_RESULT_SERIALIZER: str = "msgpack"
     CELERY_TIMEZONE: str = "UTC"
 
     # Email Configuration
@@ -53,8 +61,8 @@ class Settings(BaseSettings):
     API_KEY_HEADER_NAME: str = "X-API-KEY"
     API_KEY_PREFIX: str = "edusk_"
 
-    # CORS
-    CORS_ORIGINS: List[str] = os.getenv("CORS_ORIGINS", "https://eduschedule.name.ng,http://localhost:5173").split(",")
+    # CORS (comma-separated in the environment; parsed once by the validator below)
+    CORS_ORIGINS: Union[Tuple[str, ...], str] = os.getenv("CORS_ORIGINS", "https://eduschedule.name.ng,http://localhost:5173")
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "https://eduschedule.name.ng")
 
     # Payment Configuration
@@ -70,6 +78,8 @@ class Settings(BaseSettings):
     SCHEDULER_MAX_WORKERS: int = int(os.getenv("SCHEDULER_MAX_WORKERS", "3"))
     SCHEDULER_TIMEOUT_SECONDS: int = int(os.getenv("SCHEDULER_TIMEOUT_SECONDS", "300"))
     SOLUTION_LIMIT: int = int(os.getenv("SOLUTION_LIMIT", "5"))
+    # CP-SAT search workers per solve; keep (worker concurrency x this) near the core count
+    SOLVER_NUM_WORKERS: int = int(os.getenv("SOLVER_NUM_WORKERS", "8"))
     MAX_CONSECUTIVE_PERIODS: int = int(os.getenv("MAX_CONSECUTIVE_PERIODS", "4"))
 
     # Application Environment
@@ -89,7 +99,7 @@ class Settings(BaseSettings):
     # File Upload
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB
     UPLOAD_FOLDER: str = os.getenv("UPLOAD_FOLDER", "./uploads")
-    ALLOWED_EXTENSIONS: List[str] = os.getenv("ALLOWED_EXTENSIONS", "jpg,jpeg,png,gif,pdf,doc,docx").split(",")
+    ALLOWED_EXTENSIONS: Union[FrozenSet[str], str] = os.getenv("ALLOWED_EXTENSIONS", "jpg,jpeg,png,gif,pdf,doc,docx")
 
     # External Services
     WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
@@ -106,6 +116,8 @@ class Settings(BaseSettings):
     # Database Connection Pool
     DATABASE_POOL_SIZE: int = int(os.getenv("DATABASE_POOL_SIZE", "20"))
     DATABASE_MAX_OVERFLOW: int = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+    DATABASE_KEEPALIVE_EXPIRY: float = float(os.getenv("DATABASE_KEEPALIVE_EXPIRY", "60"))  # seconds
+    DATABASE_HTTP2: bool = os.getenv("DATABASE_HTTP2", "true").lower() == "true"
 
     # Health Check
     HEALTH_CHECK_PATH: str = "/health"
@@ -125,6 +137,18 @@ class Settings(BaseSettings):
     WORKER_CONNECTIONS: int = int(os.getenv("WORKER_CONNECTIONS", "1000"))
     WORKER_COUNT: int = int(os.getenv("WORKER_COUNT", "1"))
 
+    # The str in the Union above lets a plain comma list through the env source
+    # (which would otherwise try to JSON-decode it); these turn it into the real type
+    @field_validator('CORS_ORIGINS', mode='before')
+    @classmethod
+    def _parse_cors_origins(cls, value) -> Tuple[str, ...]:
+        return tuple(_split_csv(value))
+
+    @field_validator('ALLOWED_EXTENSIONS', mode='before')
+    @classmethod
+    def _parse_allowed_extensions(cls, value) -> FrozenSet[str]:
+        return frozenset(ext.lower() for ext in _split_csv(value))
+
     @property
     def is_production(self) -> bool:
         return self.ENVIRONMENT.lower() == "production"
@@ -138,8 +162,8 @@ class Settings(BaseSettings):
         return self.TESTING or self.ENVIRONMENT.lower() == "testing"
 
     def get_cors_origins(self) -> List[str]:
-        """Get CORS origins as a list, filtering empty strings"""
-        return [origin.strip() for origin in self.CORS_ORIGINS if origin.strip()]
+        """Get CORS origins as a list"""
+        return list(self.CORS_ORIGINS)
 
     def get_database_url(self) -> str:
         """Construct database URL for external tools if needed"""
@@ -150,17 +174,23 @@ class Settings(BaseSettings):
         env_file_encoding = "utf-8"
         case_sensitive = True
 
-@lru_cache()
+# Settings are read once at import and never reloaded
+_settings: Settings = Settings()
+
 def get_settings() -> Settings:
-    """Create cached instance of settings"""
-    return Settings()
+    """Return the settings instance"""
+    return _settings
+
+# Environment flags as plain values, for callers that only need the flag
+IS_PRODUCTION: bool = _settings.is_production
+IS_DEVELOPMENT: bool = _settings.is_development
 
 # Convenience functions
 def get_cors_origins() -> List[str]:
-    return get_settings().get_cors_origins()
+    return _settings.get_cors_origins()
 
 def is_production() -> bool:
-    return get_settings().is_production
+    return IS_PRODUCTION
 
 def is_development() -> bool:
-    return get_settings().is_development
+    return IS_DEVELOPMENT
@@ -1,31 +1,235 @@
+import asyncio
 import os
-from fastapi import Depends, HTTPException, status
+import random
+import time
+import httpx
+from functools import lru_cache
+from typing import Optional
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordBearer
-from supabase import create_client, Client
+from gotrue.types import User
+from jose import JWTError
+from postgrest import AsyncPostgrestClient, SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from postgrest.exceptions import APIError
+from postgrest.utils import AsyncClient, SyncClient
+from supabase import Client
 from dotenv import load_dotenv # <-- Uncomment this line
 
 # This function is essential for loading your .env file
 load_dotenv() # <-- Uncomment this line
 
+from core.config import get_settings
+from core.tokens import LocalVerificationUnavailable, verify_access_token
+
+settings = get_settings()
+
+# --- Connection pool for PostgREST calls ---
+# One keep-alive pool shared by every request, sized from the DATABASE_POOL_* settings
+POSTGREST_POOL_LIMITS = httpx.Limits(
+    max_connections=settings.DATABASE_POOL_SIZE + settings.DATABASE_MAX_OVERFLOW,
+    max_keepalive_connections=settings.DATABASE_POOL_SIZE,
+    keepalive_expiry=settings.DATABASE_KEEPALIVE_EXPIRY,
+)
+
+class PooledPostgrestClient(SyncPostgrestClient):
+    """
+    PostgREST client whose HTTP session uses the shared pool limits.
+    With HTTP/2 the threadpool's concurrent queries multiplex over few connections.
+    """
+
+    def create_session(self, base_url, headers, timeout) -> SyncClient:
+        return SyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=POSTGREST_POOL_LIMITS,
+            http2=settings.DATABASE_HTTP2,
+        )
+
+class PooledAsyncPostgrestClient(AsyncPostgrestClient):
+    """Async counterpart of PooledPostgrestClient, for queries awaited on the event loop."""
+
+    def create_session(self, base_url, headers, timeout) -> AsyncClient:
+        return AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=POSTGREST_POOL_LIMITS,
+            http2=settings.DATABASE_HTTP2,
+        )
+
+class PooledClient(Client):
+    """Supabase client that builds its PostgREST client on the shared pool."""
+
+    @staticmethod
+    def _init_postgrest_client(rest_url, headers, schema, timeout=None) -> SyncPostgrestClient:
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        return PooledPostgrestClient(rest_url, headers=headers, schema=schema, **kwargs)
+
 # --- Supabase Initialization ---
 url: str = os.environ.get("SUPABASE_URL")
 # Use the SERVICE_ROLE_KEY for backend operations
 key: str = os.environ.get("SUPABASE_KEY") 
-supabase: Client = create_client(url, key)
+# Which client to use:
+# - `db` (async) for every query made from request handlers; awaited on the event loop via run_query().
+# - `supabase` (sync) only where there is no event loop to await on: Celery tasks and the
+#   synchronous RBAC helpers. It also carries Supabase Auth (get_current_user's fallback).
+supabase: Client = PooledClient.create(url, key)
+db = PooledAsyncPostgrestClient(
+    f"{url}/rest/v1",
+    headers={**DEFAULT_POSTGREST_CLIENT_HEADERS, "apiKey": key, "Authorization": f"Bearer {key}"},
+)
+
+@lru_cache(maxsize=None)
+def get_admin_client() -> Client:
+    """
+    Service-role client for Supabase Auth admin calls (e.g. inviting users).
+    Built once per process so its HTTP sessions stay warm between requests.
+    Raises RuntimeError if the service role key isn't configured.
+    """
+    if not url or not settings.SUPABASE_SERVICE_ROLE_KEY:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
+    return PooledClient.create(url, settings.SUPABASE_SERVICE_ROLE_KEY)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def run_query(query):
+    """
+    Execute a query builder from async code.
+    Builders from `db` are awaited directly; those from the synchronous
+    `supabase` client run in the threadpool instead of blocking the event loop.
+    """
+    if asyncio.iscoroutinefunction(query.execute):
+        return await query.execute()
+    return await run_in_threadpool(query.execute)
+
+# --- Retries for transient Supabase failures ---
+RETRY_ATTEMPTS = 5
+RETRY_INITIAL_DELAY = 0.1
+RETRY_MAX_DELAY = 5.0
+# Gateway/rate-limit statuses (non-JSON bodies carry the status as the code) and
+# PostgREST's "could not connect/get a pool connection" codes: the write never ran
+TRANSIENT_ERROR_CODES = {429, 502, 503, 504, "PGRST000", "PGRST001", "PGRST002", "PGRST003"}
+
+def is_transient(exc: Exception, idempotent: bool = False) -> bool:
+    """
+    Whether a failed call is safe to repeat. Errors raised before the request
+    reached Postgres always are; a lost response only is for idempotent writes.
+    """
+    if isinstance(exc, APIError):
+        return exc.code in TRANSIENT_ERROR_CODES
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    return idempotent and isinstance(exc, httpx.TransportError)
+
+def _retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_INITIAL_DELAY * 2 ** attempt))
+
+def execute_with_retry(query, idempotent: bool = False, attempts: int = RETRY_ATTEMPTS):
+    """
+    query.execute() with backoff on transient failures, for worker code.
+    Pass idempotent=True for upserts keyed on client-generated ids, which may
+    also be repeated after a timed-out response.
+    """
+    for attempt in range(attempts):
+        try:
+            return query.execute()
+        except Exception as e:
+            if attempt == attempts - 1 or not is_transient(e, idempotent):
+                raise
+            time.sleep(_retry_delay(attempt))
+
+async def run_query_with_retry(query, idempotent: bool = False, attempts: int = RETRY_ATTEMPTS):
+    """run_query() with the same retry policy as execute_with_retry()."""
+    for attempt in range(attempts):
+        try:
+            return await run_query(query)
+        except Exception as e:
+            if attempt == attempts - 1 or not is_transient(e, idempotent):
+                raise
+            await asyncio.sleep(_retry_delay(attempt))
+
+@lru_cache(maxsize=None)
+def select_columns(model) -> str:
+    """
+    Comma-separated column list for a Pydantic response model, so list
+    endpoints fetch only the fields they return instead of select("*").
+    """
+    return ",".join(model.model_fields.keys())
+
+def rows_response(rows) -> ORJSONResponse:
+    """
+    Return Supabase rows as-is, without validating them against a model.
+    Only for list endpoints whose select() matches the row model exactly and
+    whose table is written solely through a SafeBaseModel create model, so the
+    free text was sanitized on the way in; validating every row again on the
+    way out is the cost this skips. A returned Response bypasses response_model,
+    so such routes document the shape with responses={200: {"model": ...}} instead.
+    None fields are dropped, as response_model_exclude_none would.
+    """
+    return ORJSONResponse(_drop_none(rows))
+
+def _drop_none(rows) -> list:
+    return [{k: v for k, v in row.items() if v is not None} for row in rows or []]
+
+async def fetch_page(query, cursor: Optional[str], limit: int, key: str = "id") -> dict:
+    """
+    One keyset page of a select: rows ordered by `key` that come after `cursor`.
+    next_cursor is the value to pass for the following page, None on the last one.
+    The select must include `key`.
+    """
+    query = query.order(key).limit(limit)
+    if cursor:
+        query = query.gt(key, cursor)
+    rows = (await run_query(query)).data or []
+    next_cursor = rows[-1][key] if len(rows) == limit else None
+    return {"data": rows, "next_cursor": next_cursor}
+
+def returning(query, columns: str):
+    """
+    Narrow the row PostgREST echoes back from an insert/update to `columns`
+    (the Prefer: return=representation body otherwise carries every column).
+    """
+    query.params = query.params.set("select", columns)
+    return query
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
     """
     Dependency to verify a Supabase JWT and get user data.
+    Tokens are verified locally; Supabase Auth is only called when no
+    local key material applies to the token. The user id is left on
+    request.state for per-user rate limiting.
     """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        claims = await verify_access_token(token)
+        request.state.user_id = claims["sub"]
+        return User.model_construct(
+            id=claims["sub"],
+            email=claims.get("email"),
+            phone=claims.get("phone"),
+            role=claims.get("role"),
+            aud=claims.get("aud"),
+            app_metadata=claims.get("app_metadata", {}),
+            user_metadata=claims.get("user_metadata", {}),
+        )
+    except (JWTError, KeyError):
+        raise credentials_exception
+    except LocalVerificationUnavailable:
+        pass
+
     try:
         # Use the Supabase client to validate the token
-        user_response = supabase.auth.get_user(token)
+        user_response = await run_in_threadpool(supabase.auth.get_user, token)
+        request.state.user_id = user_response.user.id
         return user_response.user
     except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        raise credentials_exception
@@ -0,0 +1,87 @@
+# eduschedule-backend/core/loaders.py
+import asyncio
+from typing import Any, Dict, Hashable, List, Optional
+
+from core.dependencies import db, run_query
+from core.cache import (
+    PROFILE_CACHE_TTL, cached_supabase_request, profile_cache, profile_cache_key
+)
+
+# Full rows: the same cached profile serves RBAC, plan checks, /me and /verify
+PROFILE_COLUMNS = "*"
+
+
+class BatchLoader:
+    """
+    Request-scoped DataLoader for single-row lookups.
+    Keys requested in the same event-loop tick are fetched with one
+    `.in_()` query, and each key is fetched at most once per loader.
+    """
+
+    def __init__(self, table: str, columns: str = "*", key: str = "id"):
+        self.table = table
+        self.columns = columns
+        self.key = key
+        self._futures: Dict[Hashable, asyncio.Future] = {}
+        self._pending: List[Hashable] = []
+
+    async def load(self, key: Hashable) -> Optional[dict]:
+        """Return the row whose key column equals `key`, or None if it doesn't exist."""
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._futures[key] = future
+            if not self._pending:
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+            self._pending.append(key)
+        return await future
+
+    async def load_many(self, keys: List[Hashable]) -> List[Optional[dict]]:
+        return await asyncio.gather(*(self.load(k) for k in keys))
+
+    async def _dispatch(self) -> None:
+        keys, self._pending = self._pending, []
+        try:
+            response = await run_query(
+                db.table(self.table).select(self.columns).in_(self.key, keys)
+            )
+        except Exception as e:
+            for k in keys:
+                # Drop failed keys so a later load() can retry them
+                self._futures.pop(k).set_exception(e)
+            return
+
+        rows: Dict[Any, dict] = {str(row[self.key]): row for row in response.data or []}
+        for k in keys:
+            self._futures[k].set_result(rows.get(str(k)))
+
+
+def get_profile_loader() -> BatchLoader:
+    """
+    FastAPI dependency. FastAPI caches dependency results per request, so every
+    dependency and handler in one request shares this loader.
+    """
+    return BatchLoader('profiles', PROFILE_COLUMNS)
+
+
+async def get_profile_cached(user_id: str, profiles: Optional[BatchLoader] = None) -> Optional[dict]:
+    """
+    A user's profile row, read through the in-process cache, then Redis, then
+    Supabase (via `profiles` when given, so the miss shares the request's batch).
+    Returns None if there is no profile. The dict is shared: treat it as read-only.
+    """
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        return profile
+
+    async def fetch():
+        if profiles is not None:
+            return await profiles.load(user_id)
+        response = await run_query(db.table('profiles').select(PROFILE_COLUMNS).eq('id', user_id))
+        return response.data[0] if response.data else None
+
+    profile = await cached_supabase_request(profile_cache_key(user_id), fetch, PROFILE_CACHE_TTL)
+    if profile is not None:
+        profile_cache.set(user_id, profile)
+    return profile
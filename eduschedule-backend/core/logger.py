@@ -1,39 +1,51 @@
 # eduschedule-backend/core/logger.py
+import asyncio
 import logging
 import sys
 import os
-import json
-from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
+import orjson
 from pythonjsonlogger import jsonlogger
-from functools import wraps
+from starlette.requests import Request
+from functools import lru_cache, wraps
+import inspect
 import traceback
 import time
 
-class CustomJsonFormatter(jsonlogger.JsonFormatter):
-    """Custom JSON formatter with additional context fields."""
+# Same on every record, so resolved once instead of per add_fields call
+STATIC_LOG_FIELDS = {
+    'service': 'eduschedule-backend',
+    'version': os.getenv('APP_VERSION', '1.0.0'),
+    'environment': os.getenv('ENVIRONMENT', 'development'),
+}
 
-    def add_fields(self, log_record: Dict[str, Any], record: logging.LogRecord, message_dict: Dict[str, Any]) -> None:
-        super().add_fields(log_record, record, message_dict)
+# Datetimes in log records are written as UTC ISO 8601 with a trailing Z
+ORJSON_LOG_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
 
-        # Add timestamp in ISO format
-        if not log_record.get('timestamp'):
-            log_record['timestamp'] = datetime.utcnow().isoformat() + 'Z'
+def _orjson_default(obj: Any) -> str:
+    """Fallback for values orjson can't encode, as jsonlogger.JsonEncoder does."""
+    if jsonlogger.istraceback(obj):
+        return ''.join(traceback.format_tb(obj)).strip()
+    return str(obj)
 
-        # Add service information
-        log_record['service'] = 'eduschedule-backend'
-        log_record['version'] = os.getenv('APP_VERSION', '1.0.0')
-        log_record['environment'] = os.getenv('ENVIRONMENT', 'development')
+def _orjson_serializer(log_record: Dict[str, Any], **_: Any) -> str:
+    """json.dumps-compatible serializer; the json.dumps-only kwargs are ignored."""
+    return orjson.dumps(log_record, default=_orjson_default, option=ORJSON_LOG_OPTIONS).decode()
 
-        # Add request context if available
-        if hasattr(record, 'request_id'):
-            log_record['request_id'] = record.request_id
+class CustomJsonFormatter(jsonlogger.JsonFormatter):
+    """Custom JSON formatter with additional context fields."""
 
-        if hasattr(record, 'user_id'):
-            log_record['user_id'] = record.user_id
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('json_serializer', _orjson_serializer)
+        kwargs.setdefault('static_fields', STATIC_LOG_FIELDS)
+        # Timestamp taken from record.created, so no extra clock read per record
+        kwargs.setdefault('timestamp', True)
+        super().__init__(*args, **kwargs)
 
-        if hasattr(record, 'correlation_id'):
-            log_record['correlation_id'] = record.correlation_id
+    def add_fields(self, log_record: Dict[str, Any], record: logging.LogRecord, message_dict: Dict[str, Any]) -> None:
+        # Adds the timestamp and static fields, plus any extra= context
+        # (request_id, user_id, correlation_id, ...) set on the record
+        super().add_fields(log_record, record, message_dict)
 
         # Add exception information if present
         if record.exc_info:
@@ -51,55 +63,55 @@ class CustomJsonFormatter(jsonlogger.JsonFormatter):
         log_record['level'] = record.levelname
         log_record['logger'] = record.name
 
-class ContextFilter(logging.Filter):
-    """Filter to add contextual information to log records."""
-
-    def filter(self, record: logging.LogRecord) -> bool:
-        # Add thread information
-        import threading
-        record.thread_name = threading.current_thread().name
-
-        # Add process information
-        record.process_id = os.getpid()
-
-        return True
+_base_record_factory = logging.getLogRecordFactory()
+
+def _context_record_factory(*args, **kwargs) -> logging.LogRecord:
+    """Build log records carrying thread/process context.
+
+    Stamped once per record rather than by a filter on every handler. LogRecord
+    already captured threadName and process, so these are plain copies and stay
+    correct in forked workers.
+    """
+    record = _base_record_factory(*args, **kwargs)
+    record.thread_name = record.threadName
+    record.process_id = record.process
+    return record
+
+def _emit_perf(logger: logging.Logger, operation: str, start_ns: int, success: bool,
+               level: int = logging.INFO, extra: Optional[Dict[str, Any]] = None) -> None:
+    """Log one "Completed"/"Failed" record for an operation timed from start_ns."""
+    if not logger.isEnabledFor(level if success else logging.ERROR):
+        return
+    fields = {
+        'duration': (time.perf_counter_ns() - start_ns) / 1e6,  # milliseconds
+        'operation': operation,
+        'success': success,
+    }
+    if extra:
+        fields.update(extra)
+    if success:
+        logger.log(level, "Completed %s", operation, extra=fields)
+    else:
+        logger.error("Failed %s", operation, extra=fields)
 
 class PerformanceLogger:
     """Context manager for logging performance metrics."""
 
+    __slots__ = ('logger', 'operation', 'level', 'start_ns')
+
     def __init__(self, logger: logging.Logger, operation: str, level: int = logging.INFO):
         self.logger = logger
         self.operation = operation
         self.level = level
-        self.start_time = None
+        self.start_ns = 0
 
     def __enter__(self):
-        self.start_time = time.time()
-        self.logger.log(self.level, f"Starting {self.operation}")
+        self.logger.debug("Starting %s", self.operation)
+        self.start_ns = time.perf_counter_ns()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        duration = (time.time() - self.start_time) * 1000  # Convert to milliseconds
-
-        if exc_type:
-            self.logger.error(
-                f"Failed {self.operation}",
-                extra={
-                    'duration': duration,
-                    'operation': self.operation,
-                    'success': False
-                }
-            )
-        else:
-            self.logger.log(
-                self.level,
-                f"Completed {self.operation}",
-                extra={
-                    'duration': duration,
-                    'operation': self.operation,
-                    'success': True
-                }
-            )
+        _emit_perf(self.logger, self.operation, self.start_ns, exc_type is None, self.level)
 
 def setup_logging() -> logging.Logger:
     """Configure production-ready structured logging."""
@@ -109,6 +121,9 @@ def setup_logging() -> logging.Logger:
     log_format = os.getenv('LOG_FORMAT', 'json').lower()
     log_file = os.getenv('LOG_FILE', None)
 
+    # Add thread/process context to every record
+    logging.setLogRecordFactory(_context_record_factory)
+
     # Create root logger
     logger = logging.getLogger()
 
@@ -133,7 +148,6 @@ def setup_logging() -> logging.Logger:
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    console_handler.addFilter(ContextFilter())
     logger.addHandler(console_handler)
 
     # File handler (if specified)
@@ -144,7 +158,6 @@ def setup_logging() -> logging.Logger:
 
             file_handler = logging.FileHandler(log_file, mode='a', encoding='utf-8')
             file_handler.setFormatter(formatter)
-            file_handler.addFilter(ContextFilter())
             logger.addHandler(file_handler)
         except Exception as e:
             logger.error(f"Failed to create file handler for {log_file}: {e}")
@@ -161,105 +174,110 @@ def get_logger(name: str) -> logging.Logger:
     """Get a logger instance with the specified name."""
     return logging.getLogger(name)
 
+def _request_param(func) -> Optional[Tuple[str, int]]:
+    """Name and position of func's Request parameter, or None if it takes none."""
+    for index, param in enumerate(inspect.signature(func).parameters.values()):
+        if param.annotation is Request or param.name == 'request':
+            return param.name, index
+    return None
+
 def log_api_call(func):
     """Decorator to log API calls with request/response information."""
-    @wraps(func)
-    async def async_wrapper(*args, **kwargs):
-        logger = get_logger(f"api.{func.__module__}.{func.__name__}")
-
-        # Extract request information
-        request_info = {}
-        for arg in args:
-            if hasattr(arg, 'method') and hasattr(arg, 'url'):  # FastAPI Request
-                request_info = {
-                    'method': arg.method,
-                    'path': str(arg.url.path),
-                    'query_params': dict(arg.query_params),
-                    'user_agent': arg.headers.get('user-agent', 'unknown')
-                }
-                break
-
-        with PerformanceLogger(logger, f"API {func.__name__}"):
+    # Resolved once here rather than on every call
+    logger = get_logger(f"api.{func.__module__}.{func.__name__}")
+    name = func.__name__
+    operation = f"API {name}"
+    # Handlers without a Request parameter skip the lookup
+    request_param = _request_param(func)
+
+    if asyncio.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            # Extract request information
+            request_info = {}
+            if request_param is not None:
+                param_name, index = request_param
+                req = kwargs.get(param_name)
+                if req is None and index < len(args):
+                    req = args[index]
+                if isinstance(req, Request):
+                    request_info = {
+                        'method': req.method,
+                        'path': req.url.path,
+                        'query_params': dict(req.query_params),
+                        'user_agent': req.headers.get('user-agent', 'unknown')
+                    }
+
+            start = time.perf_counter_ns()
             try:
                 result = await func(*args, **kwargs)
-                logger.info(
-                    f"API call successful: {func.__name__}",
-                    extra={'request': request_info, 'function': func.__name__}
-                )
-                return result
             except Exception as e:
-                logger.error(
-                    f"API call failed: {func.__name__}",
-                    extra={
-                        'request': request_info,
-                        'function': func.__name__,
-                        'error': str(e)
-                    }
-                )
+                _emit_perf(logger, operation, start, False, extra={
+                    'request': request_info,
+                    'function': name,
+                    'error': str(e)
+                })
                 raise
+            _emit_perf(logger, operation, start, True, extra={'request': request_info, 'function': name})
+            return result
+
+        return async_wrapper
 
     @wraps(func)
     def sync_wrapper(*args, **kwargs):
-        logger = get_logger(f"api.{func.__module__}.{func.__name__}")
-
-        with PerformanceLogger(logger, f"API {func.__name__}"):
-            try:
-                result = func(*args, **kwargs)
-                logger.info(f"API call successful: {func.__name__}")
-                return result
-            except Exception as e:
-                logger.error(f"API call failed: {func.__name__}: {str(e)}")
-                raise
+        start = time.perf_counter_ns()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            _emit_perf(logger, operation, start, False, extra={'error': str(e)})
+            raise
+        _emit_perf(logger, operation, start, True)
+        return result
 
-    # Return appropriate wrapper based on function type
-    import asyncio
-    if asyncio.iscoroutinefunction(func):
-        return async_wrapper
-    else:
-        return sync_wrapper
+    return sync_wrapper
 
 def log_task_execution(func):
     """Decorator to log Celery task execution."""
+    logger = get_logger(f"task.{func.__module__}.{func.__name__}")
+    operation = f"Task {func.__name__}"
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        logger = get_logger(f"task.{func.__module__}.{func.__name__}")
-
-        with PerformanceLogger(logger, f"Task {func.__name__}"):
-            try:
-                result = func(*args, **kwargs)
-                logger.info(
-                    f"Task completed successfully: {func.__name__}",
-                    extra={'args': str(args)[:200], 'kwargs': str(kwargs)[:200]}
-                )
-                return result
-            except Exception as e:
-                logger.error(
-                    f"Task failed: {func.__name__}",
-                    extra={
-                        'args': str(args)[:200],
-                        'kwargs': str(kwargs)[:200],
-                        'error': str(e)
-                    }
-                )
-                raise
+        start = time.perf_counter_ns()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            _emit_perf(logger, operation, start, False, extra={
+                'task_args': str(args)[:200],
+                'task_kwargs': str(kwargs)[:200],
+                'error': str(e)
+            })
+            raise
+        _emit_perf(logger, operation, start, True, extra={
+            'task_args': str(args)[:200], 'task_kwargs': str(kwargs)[:200]
+        })
+        return result
 
     return wrapper
 
+@lru_cache(maxsize=16)
 def log_database_operation(operation_type: str):
-    """Decorator to log database operations."""
+    """Decorator to log database operations; one shared decorator per operation type."""
+    operation = f"DB {operation_type}"
+
     def decorator(func):
+        logger = get_logger(f"database.{func.__module__}.{func.__name__}")
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            logger = get_logger(f"database.{func.__module__}.{func.__name__}")
-
-            with PerformanceLogger(logger, f"DB {operation_type}"):
-                try:
-                    result = func(*args, **kwargs)
-                    logger.info(f"Database {operation_type} successful")
-                    return result
-                except Exception as e:
-                    logger.error(f"Database {operation_type} failed: {str(e)}")
-                    raise
+            start = time.perf_counter_ns()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                _emit_perf(logger, operation, start, False, extra={'error': str(e)})
+                raise
+            _emit_perf(logger, operation, start, True)
+            return result
 
         return wrapper
     return decorator
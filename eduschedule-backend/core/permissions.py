@@ -1,6 +1,9 @@
 import logging
 from fastapi import HTTPException, Depends
-from core.dependencies import get_current_user, supabase
+from redis.exceptions import RedisError
+from core.dependencies import get_current_user, db, run_query
+from core.loaders import BatchLoader, get_profile_cached, get_profile_loader
+from core.cache import redis_client
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +32,65 @@ PLAN_LIMITS = {
     }
 }
 
+# Plan-limited tables reported by get_user_usage
+USAGE_RESOURCES = ('teachers', 'rooms', 'subjects', 'classes')
+
+# Usage counters are backfilled from a count query on a miss and expire so drift self-heals.
+# Backfills use SET NX so they never clobber a counter a concurrent create/delete just adjusted.
+USAGE_COUNTER_TTL = 3600
+
+# Adjust a counter only if it is already cached; a missing key is backfilled on the next check
+_INCR_IF_EXISTS = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return redis.call('incrby', KEYS[1], ARGV[1])
+end
+return nil
+"""
+
+
+def _usage_key(user_id: str, table_name: str) -> str:
+    return f"count:{user_id}:{table_name}"
+
+
+async def _count_rows(user_id: str, table_name: str) -> int:
+    response = await run_query(
+        db.table(table_name).select('id', count='exact').eq('user_id', user_id).limit(1)
+    )
+    return response.count or 0
+
+
+async def get_usage_count(user_id: str, table_name: str) -> int:
+    """Rows owned by the user in `table_name`, served from the Redis counter when cached."""
+    key = _usage_key(user_id, table_name)
+    try:
+        cached = await redis_client.get(key)
+        if cached is not None:
+            return int(cached)
+    except RedisError as e:
+        logger.warning(f"Usage counter read failed for {key}: {e}")
+        return await _count_rows(user_id, table_name)
+
+    count = await _count_rows(user_id, table_name)
+    try:
+        await redis_client.set(key, count, ex=USAGE_COUNTER_TTL, nx=True)
+    except RedisError as e:
+        logger.warning(f"Usage counter backfill failed for {key}: {e}")
+    return count
+
+
+async def record_usage_change(user_id: str, table_name: str, delta: int) -> None:
+    """Call after a successful insert (+1) or delete (-1) of a plan-limited row."""
+    key = _usage_key(user_id, table_name)
+    try:
+        await redis_client.eval(_INCR_IF_EXISTS, 1, key, delta)
+    except RedisError as e:
+        logger.warning(f"Usage counter update failed for {key}: {e}")
+        # Drop the counter so the next check recounts instead of trusting a stale value
+        try:
+            await redis_client.delete(key)
+        except RedisError:
+            pass
+
 
 def check_plan_limits(resource: str):
     """
@@ -40,32 +102,36 @@ def check_plan_limits(resource: str):
     Returns:
         A dependency function that returns the current user if within limits, otherwise raises HTTPException
     """
-    async def _check_limits(user=Depends(get_current_user)):
+    # Resolved once per guarded route rather than on every request
+    limit_by_plan = {plan: limits.get(resource, 0) for plan, limits in PLAN_LIMITS.items()}
+    table_name = resource if resource != 'timetables_per_month' else 'timetables'
+
+    async def _check_limits(
+        user=Depends(get_current_user),
+        profiles: BatchLoader = Depends(get_profile_loader)
+    ):
         try:
-            # 1. Get User Profile and Plan
-            profile_response = supabase.table('profiles').select('plan').eq('id', user.id).single().execute()
+            # 1. Get User Profile and Plan (shared with any RBAC check in this request)
+            profile = await get_profile_cached(user.id, profiles)
 
-            if not profile_response.data:
+            if not profile:
                 logger.warning(f"Profile not found for user {user.id}")
                 raise HTTPException(
                     status_code=500,
                     detail="User profile not found"
                 )
 
-            plan = profile_response.data.get('plan', 'free')
+            plan = profile.get('plan') or 'free'
 
             # Validate plan
-            if plan not in PLAN_LIMITS:
+            limit = limit_by_plan.get(plan)
+            if limit is None:
                 logger.warning(f"Invalid plan '{plan}' for user {user.id}")
                 plan = 'free'
-
-            limit = PLAN_LIMITS[plan].get(resource, 0)
+                limit = limit_by_plan['free']
 
             # 2. Count Current Usage
-            table_name = resource if resource != 'timetables_per_month' else 'timetables'
-
-            count_response = supabase.table(table_name).select('*', count='exact').eq('user_id', user.id).execute()
-            current_count = count_response.count or 0
+            current_count = await get_usage_count(user.id, table_name)
 
             # 3. Check if at limit
             if current_count >= limit:
@@ -92,12 +158,15 @@ def check_plan_limits(resource: str):
     return _check_limits
 
 
-async def get_user_plan(user=Depends(get_current_user)) -> str:
+async def get_user_plan(
+    user=Depends(get_current_user),
+    profiles: BatchLoader = Depends(get_profile_loader)
+) -> str:
     """Get the current user's plan."""
     try:
-        profile_response = supabase.table('profiles').select('plan').eq('id', user.id).single().execute()
-        if profile_response.data:
-            return profile_response.data.get('plan', 'free')
+        profile = await get_profile_cached(user.id, profiles)
+        if profile:
+            return profile.get('plan') or 'free'
         return 'free'
     except Exception as e:
         logger.error(f"Error fetching user plan: {str(e)}")
@@ -109,15 +178,35 @@ def get_plan_limits(plan: str) -> dict:
     return PLAN_LIMITS.get(plan, PLAN_LIMITS['free'])
 
 
-def get_user_usage(user_id: str) -> dict:
-    """Get the current user's resource usage across all limits."""
+async def get_user_usage(user_id: str) -> dict:
+    """
+    Get the current user's resource usage across all limits.
+    One MGET for the cached counters; any misses are counted together in one RPC.
+    """
+    keys = [_usage_key(user_id, resource) for resource in USAGE_RESOURCES]
     try:
-        usage = {}
-        for resource in ['teachers', 'rooms', 'subjects', 'classes']:
-            table_name = resource
-            response = supabase.table(table_name).select('*', count='exact').eq('user_id', user_id).execute()
-            usage[resource] = response.count or 0
+        cached = await redis_client.mget(keys)
+    except RedisError as e:
+        logger.warning(f"Usage counter read failed for user {user_id}: {e}")
+        cached = [None] * len(keys)
+
+    usage = {resource: int(value) for resource, value in zip(USAGE_RESOURCES, cached) if value is not None}
+    if len(usage) == len(USAGE_RESOURCES):
         return usage
+
+    try:
+        response = await run_query(db.rpc('count_user_resources', {'p_user_id': user_id}))
     except Exception as e:
         logger.error(f"Error fetching user usage: {str(e)}")
         return {}
+
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key, resource in zip(keys, USAGE_RESOURCES):
+                if resource not in usage:
+                    pipe.set(key, response.data[resource], ex=USAGE_COUNTER_TTL, nx=True)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Usage counter backfill failed for user {user_id}: {e}")
+
+    return {resource: usage.get(resource, response.data[resource]) for resource in USAGE_RESOURCES}
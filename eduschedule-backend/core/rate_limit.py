@@ -0,0 +1,22 @@
+# eduschedule-backend/core/rate_limit.py
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+from starlette.requests import Request
+from core.config import get_settings
+
+
+def user_or_ip(request: Request) -> str:
+    """Rate-limit key: the authenticated user (set by get_current_user) when known, else the client IP."""
+    user_id = getattr(request.state, "user_id", None)
+    return f"user:{user_id}" if user_id else f"ip:{get_remote_address(request)}"
+
+
+# One limiter for the app. Windows live in Redis, so all workers and replicas
+# share them; moving-window checks are a single atomic Lua call per request.
+# If Redis is unreachable, limits fall back to per-worker memory rather than failing requests.
+limiter = Limiter(
+    key_func=user_or_ip,
+    storage_uri=get_settings().REDIS_URL,
+    strategy="moving-window",
+    in_memory_fallback_enabled=True,
+)
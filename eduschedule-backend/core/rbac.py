@@ -1,6 +1,12 @@
-from fastapi import HTTPException, status
+import logging
+from datetime import datetime, timezone
+from fastapi import Depends, HTTPException, status
 from typing import List, Optional
-from core.dependencies import supabase
+from core.dependencies import get_current_user, supabase
+from core.cache import profile_cache, queue_security_event
+from core.loaders import PROFILE_COLUMNS, BatchLoader, get_profile_cached, get_profile_loader
+
+logger = logging.getLogger(__name__)
 
 class RBACError(HTTPException):
     """Custom exception for RBAC violations"""
@@ -36,20 +42,49 @@ class RolePermissions:
         "view_timetable"
     ]
 
+# (role, permission) pairs granted above, built once for O(1) checks
+ROLE_PERMISSIONS = frozenset(
+    (role, permission)
+    for role, permissions in (
+        ('admin', RolePermissions.ADMIN),
+        ('teacher', RolePermissions.TEACHER),
+        ('student', RolePermissions.STUDENT),
+    )
+    for permission in permissions
+)
+
 def get_user_profile(user_id: str) -> dict:
-    """Get user profile with role and school information"""
+    """
+    Get user profile with role and school information.
+    Reads through the same per-worker cache as load_user_profile, for sync callers.
+    """
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        return profile
+
     try:
-        response = supabase.table('profiles').select(
-            "id, role, school_id, email, name"
-        ).eq('id', user_id).single().execute()
+        response = supabase.table('profiles').select(PROFILE_COLUMNS).eq('id', user_id).maybe_single().execute()
+    except Exception as e:
+        raise RBACError(f"Failed to get user profile: {str(e)}")
+
+    if not response or not response.data:
+        raise RBACError("User profile not found")
 
-        if not response.data:
-            raise RBACError("User profile not found")
+    profile_cache.set(user_id, response.data)
+    return response.data
 
-        return response.data
+async def load_user_profile(user_id: str, profiles: BatchLoader) -> dict:
+    """Cached variant of get_user_profile; misses share the request's batched lookup"""
+    try:
+        profile = await get_profile_cached(user_id, profiles)
     except Exception as e:
         raise RBACError(f"Failed to get user profile: {str(e)}")
 
+    if not profile:
+        raise RBACError("User profile not found")
+
+    return profile
+
 def require_role(user: dict, allowed_roles: List[str]) -> dict:
     """Ensure user has one of the allowed roles"""
     user_role = user.get('role')
@@ -107,15 +142,7 @@ def require_permission(user: dict, permission: str) -> dict:
     """Check if user has specific permission"""
     user_role = user.get('role')
 
-    role_permissions = {
-        'admin': RolePermissions.ADMIN,
-        'teacher': RolePermissions.TEACHER,
-        'student': RolePermissions.STUDENT
-    }
-
-    permissions = role_permissions.get(user_role, [])
-
-    if permission not in permissions:
+    if (user_role, permission) not in ROLE_PERMISSIONS:
         raise RBACError(f"Permission '{permission}' denied for role '{user_role}'")
 
     return user
@@ -136,44 +163,55 @@ def validate_school_access(user: dict, school_id: str) -> dict:
     return user
 
 # Convenience decorators for FastAPI dependencies
-def admin_required(current_user: dict) -> dict:
+async def admin_required(
+    current_user=Depends(get_current_user),
+    profiles: BatchLoader = Depends(get_profile_loader)
+) -> dict:
     """FastAPI dependency to require admin role"""
-    profile = get_user_profile(current_user.id)
+    profile = await load_user_profile(current_user.id, profiles)
     return require_admin(profile)
 
-def teacher_or_admin_required(current_user: dict) -> dict:
+async def teacher_or_admin_required(
+    current_user=Depends(get_current_user),
+    profiles: BatchLoader = Depends(get_profile_loader)
+) -> dict:
     """FastAPI dependency to require teacher or admin role"""
-    profile = get_user_profile(current_user.id)
+    profile = await load_user_profile(current_user.id, profiles)
     return require_admin_or_teacher(profile)
 
 def same_school_required(school_id: str):
     """FastAPI dependency factory to require same school"""
-    def _check_school(current_user: dict) -> dict:
-        profile = get_user_profile(current_user.id)
+    async def _check_school(
+        current_user=Depends(get_current_user),
+        profiles: BatchLoader = Depends(get_profile_loader)
+    ) -> dict:
+        profile = await load_user_profile(current_user.id, profiles)
         return validate_school_access(profile, school_id)
     return _check_school
 
 # Audit logging for security events
 def log_rbac_violation(user_id: str, action: str, resource: str, reason: str):
-    """Log RBAC violations for security monitoring"""
-    try:
-        supabase.table('security_log').insert({
-            'user_id': user_id,
-            'action': action,
-            'resource': resource,
-            'violation_reason': reason,
-            'timestamp': 'now()',
-            'severity': 'high'
-        }).execute()
-    except Exception as e:
-        # Don't fail the request if logging fails, but print for debugging
-        print(f"Failed to log RBAC violation: {e}")
+    """
+    Log RBAC violations for security monitoring.
+    Rows are queued in Redis and inserted in batches by a Celery beat task, so a
+    denial doesn't wait on a database write (and a flood of them can't pile up writes).
+    """
+    # Never raises: a logging failure must not fail the request
+    queue_security_event({
+        'user_id': user_id,
+        'action': action,
+        'resource': resource,
+        'violation_reason': reason,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'severity': 'high'
+    })
 
 def check_resource_ownership(user: dict, resource_table: str, resource_id: str, id_field: str = 'id') -> dict:
     """Verify user owns or can access a specific resource"""
     try:
         # Get the resource
-        resource = supabase.table(resource_table).select("*").eq(id_field, resource_id).single().execute().data
+        response = supabase.table(resource_table).select("*").eq(id_field, resource_id).maybe_single().execute()
+        resource = response.data if response else None
 
         if not resource:
             raise RBACError("Resource not found")
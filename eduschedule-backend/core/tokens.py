@@ -0,0 +1,82 @@
+# eduschedule-backend/core/tokens.py
+"""
+Local verification of Supabase access tokens.
+
+Tokens are checked in-process with python-jose instead of a round-trip
+to Supabase Auth on every request:
+- HS256 tokens are verified against SUPABASE_JWT_SECRET.
+- Asymmetric tokens (RS256/ES256) are verified against the project's
+  JWKS, which is cached by `kid` and refetched on expiry or a `kid` miss.
+"""
+import asyncio
+import time
+from typing import Dict
+
+import httpx
+from jose import jwt
+
+from core.config import get_settings
+
+settings = get_settings()
+
+JWKS_URL = f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json"
+TOKEN_AUDIENCE = "authenticated"
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+# Floor between refetches so tokens with made-up kids can't hammer the JWKS endpoint
+JWKS_MIN_REFRESH_SECONDS = 30
+
+class LocalVerificationUnavailable(Exception):
+    """The token can't be checked locally; the caller should ask Supabase Auth."""
+
+# Held only while the JWKS is refetched: one request fetches, the others with
+# the same miss wait for it without blocking the event loop
+_jwks_lock = asyncio.Lock()
+_jwks_keys: Dict[str, dict] = {}
+_jwks_fetched_at = 0.0
+jwks_client = httpx.AsyncClient(timeout=5)
+
+def _needs_refresh(kid: str) -> bool:
+    age = time.monotonic() - _jwks_fetched_at
+    return age > settings.JWKS_CACHE_TTL or (kid not in _jwks_keys and age > JWKS_MIN_REFRESH_SECONDS)
+
+async def _refresh_jwks() -> None:
+    global _jwks_keys, _jwks_fetched_at
+    _jwks_fetched_at = time.monotonic()
+    response = await jwks_client.get(JWKS_URL)
+    response.raise_for_status()
+    _jwks_keys = {k["kid"]: k for k in response.json().get("keys", []) if "kid" in k}
+
+async def _get_signing_key(kid: str) -> dict:
+    # A miss during an in-flight refetch waits for it rather than failing early
+    if _needs_refresh(kid) or (kid not in _jwks_keys and _jwks_lock.locked()):
+        async with _jwks_lock:
+            # Re-checked under the lock: a concurrent caller may have just refetched
+            if _needs_refresh(kid):
+                try:
+                    await _refresh_jwks()
+                except httpx.HTTPError as e:
+                    raise LocalVerificationUnavailable(f"JWKS fetch failed: {e}") from e
+    key = _jwks_keys.get(kid)
+    if key is None:
+        raise LocalVerificationUnavailable(f"Unknown signing key: {kid}")
+    return key
+
+async def verify_access_token(token: str) -> dict:
+    """
+    Verify a Supabase access token locally and return its claims.
+    Raises jose.JWTError for invalid or expired tokens and
+    LocalVerificationUnavailable when no local key material applies.
+    """
+    header = jwt.get_unverified_header(token)
+    alg = header.get("alg")
+
+    if alg == "HS256":
+        if not settings.SUPABASE_JWT_SECRET:
+            raise LocalVerificationUnavailable("SUPABASE_JWT_SECRET is not set")
+        key = settings.SUPABASE_JWT_SECRET
+    elif alg in ASYMMETRIC_ALGORITHMS and header.get("kid"):
+        key = await _get_signing_key(header["kid"])
+    else:
+        raise LocalVerificationUnavailable(f"Unsupported token algorithm: {alg}")
+
+    return jwt.decode(token, key, algorithms=[alg], audience=TOKEN_AUDIENCE)
@@ -7,10 +7,17 @@ create table public.profiles (
   email text unique not null,
   name text,
   school_name text,
+  -- Same text form as the school_id on teachers/rooms/subjects/classes; the RLS
+  -- policies and the onboarding functions below match and write it
+  school_id text,
   role text default 'guest',
   plan text default 'free',
   subscription_status text default 'active',
-  created_at timestamp with time zone default timezone('utc'::text, now()) not null
+  -- Sign-up offer window, set by /api/auth/verify and read by /api/users/deal-status
+  deal_offered_at timestamp with time zone,
+  deal_expires_at timestamp with time zone,
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+  updated_at timestamp with time zone default timezone('utc'::text, now()) not null
 );
 
 -- Enable RLS for profiles
@@ -39,6 +46,31 @@ create table public.teachers (
 
 alter table public.teachers enable row level security;
 
+-- Mirror the API's filters so a PATCH/DELETE on rows outside the caller's
+-- reach simply matches nothing (the API answers 404) in a single statement.
+create policy "Admins can update teachers in their school"
+on public.teachers for update to authenticated
+using ( exists (
+  select 1 from public.profiles p
+  where p.id = auth.uid() and p.role = 'admin' and p.school_id = teachers.school_id
+) )
+with check ( exists (
+  select 1 from public.profiles p
+  where p.id = auth.uid() and p.role = 'admin' and p.school_id = teachers.school_id
+) );
+
+create policy "Teachers can update their own teacher record"
+on public.teachers for update to authenticated
+using ( user_id = auth.uid() )
+with check ( user_id = auth.uid() );
+
+create policy "Admins can delete teachers in their school"
+on public.teachers for delete to authenticated
+using ( exists (
+  select 1 from public.profiles p
+  where p.id = auth.uid() and p.role = 'admin' and p.school_id = teachers.school_id
+) );
+
 create table public.rooms (
   id uuid default gen_random_uuid() primary key,
   user_id uuid references public.profiles(id) on delete set null,
@@ -117,14 +149,28 @@ alter table public.assignments enable row level security;
 create table public.api_keys (
   id uuid default gen_random_uuid() primary key,
   user_id uuid references public.profiles(id) on delete cascade,
-  key_hash text not null,
-  label text,
-  last_used_at timestamp with time zone,
+  -- Raw 32-byte digest; existing hex text columns convert with
+  -- alter column key_hash type bytea using decode(key_hash, 'hex')
+  key_hash bytea not null,
+  key_preview text,
+  description text,
+  is_active boolean default true not null,
+  last_used timestamp with time zone,
   created_at timestamp with time zone default now()
 );
 
 alter table public.api_keys enable row level security;
 
+-- Owners may list and revoke their own keys; with the owner filter in the
+-- policy, one DELETE both authorizes and removes the row
+create policy "Users can view their own API keys"
+on public.api_keys for select to authenticated
+using ( user_id = auth.uid() );
+
+create policy "Users can delete their own API keys"
+on public.api_keys for delete to authenticated
+using ( user_id = auth.uid() );
+
 -- 5. INDEXES for Performance
 
 create index idx_teachers_user_id on public.teachers(user_id);
@@ -133,10 +179,184 @@ create index idx_subjects_user_id on public.subjects(user_id);
 create index idx_classes_user_id on public.classes(user_id);
 create index idx_timetables_user_id on public.timetables(user_id);
 create index idx_assignments_timetable_id on public.assignments(timetable_id);
-create index idx_assignments_candidate_id on public.assignments(candidate_id);
+-- Covers validate_assignment_move: slot lookup answered as an index-only scan.
+-- Also serves plain candidate_id lookups through its leading column.
+create index idx_assignments_slot on public.assignments(candidate_id, day_of_week, period)
+  include (teacher_id, room_id, class_id);
 create index idx_candidates_timetable_id on public.candidates(timetable_id);
 create index idx_api_keys_user_id on public.api_keys(user_id);
-create index idx_teachers_school_id on public.teachers(school_id);
+-- verify_api_key looks keys up by hash; unique so a hash maps to exactly one key.
+-- Deliberately not partial on is_active: revoked keys must still be found (to be
+-- rejected as inactive), and their hashes must never be reissued.
+create unique index idx_api_keys_key_hash on public.api_keys(key_hash);
+-- Serves school-scoped teacher reads/writes, incl. a teacher editing their own row
+create index idx_teachers_school_user on public.teachers(school_id, user_id);
 create index idx_rooms_school_id on public.rooms(school_id);
 create index idx_subjects_school_id on public.subjects(school_id);
 create index idx_classes_school_id on public.classes(school_id);
+
+
+-- 6. FUNCTIONS (called from the API via supabase.rpc)
+
+-- Drag-and-drop move validation: one round-trip instead of a lookup plus
+-- a conflict query per resource. Uses idx_assignments_slot.
+create or replace function public.validate_assignment_move(
+  p_assignment_id uuid,
+  p_day int,
+  p_period int
+) returns jsonb
+language plpgsql stable
+as $$
+declare
+  moved public.assignments%rowtype;
+begin
+  select * into moved from public.assignments where id = p_assignment_id;
+  if not found then
+    return jsonb_build_object('valid', false, 'reason', 'Assignment not found.');
+  end if;
+
+  if exists (
+    select 1 from public.assignments a
+    where a.candidate_id = moved.candidate_id and a.day_of_week = p_day and a.period = p_period
+      and a.teacher_id = moved.teacher_id
+  ) then
+    return jsonb_build_object('valid', false, 'reason', 'Teacher has another class at this time.');
+  end if;
+
+  if exists (
+    select 1 from public.assignments a
+    where a.candidate_id = moved.candidate_id and a.day_of_week = p_day and a.period = p_period
+      and a.room_id = moved.room_id
+  ) then
+    return jsonb_build_object('valid', false, 'reason', 'Room is already occupied at this time.');
+  end if;
+
+  if exists (
+    select 1 from public.assignments a
+    where a.candidate_id = moved.candidate_id and a.day_of_week = p_day and a.period = p_period
+      and a.class_id = moved.class_id
+  ) then
+    return jsonb_build_object('valid', false, 'reason', 'This class already has a lesson at this time.');
+  end if;
+
+  return jsonb_build_object('valid', true);
+end;
+$$;
+
+-- Teacher onboarding: create the profile and the teacher row atomically.
+create or replace function public.add_teacher(
+  p_user_id uuid,
+  p_name text,
+  p_email text,
+  p_school_id text
+) returns public.teachers
+language plpgsql
+as $$
+declare
+  new_teacher public.teachers;
+begin
+  insert into public.profiles (id, name, email, role, school_id)
+  values (p_user_id, p_name, p_email, 'teacher', p_school_id);
+
+  insert into public.teachers (user_id, school_id, name, email)
+  values (p_user_id, p_school_id, p_name, p_email)
+  returning * into new_teacher;
+
+  return new_teacher;
+end;
+$$;
+
+-- School onboarding: create the school and link the owner's profile atomically.
+-- Returns jsonb rather than public.schools so this file does not depend on that table's definition.
+create or replace function public.create_school_and_link(
+  p_owner uuid,
+  p_name text
+) returns jsonb
+language plpgsql
+as $$
+declare
+  new_school record;
+begin
+  insert into public.schools (name, owner_id)
+  values (p_name, p_owner)
+  returning * into new_school;
+
+  update public.profiles set school_id = new_school.id where id = p_owner;
+
+  return to_jsonb(new_school);
+end;
+$$;
+
+-- Timetable removal in one statement; candidates and assignments go via their
+-- on delete cascade foreign keys. Returns false if the timetable didn't exist.
+create or replace function public.delete_timetable_cascade(
+  p_timetable_id uuid
+) returns boolean
+language plpgsql
+as $$
+begin
+  delete from public.timetables where id = p_timetable_id;
+  return found;
+end;
+$$;
+
+-- Batched API key usage: p_last_used maps key_hash (\x-hex) -> Unix time. Keys deleted
+-- since their use are skipped, and last_used never moves backwards.
+create or replace function public.touch_api_keys(
+  p_last_used jsonb
+) returns void
+language plpgsql
+as $$
+begin
+  update public.api_keys k
+  set last_used = greatest(k.last_used, to_timestamp(u.used_at::double precision))
+  from jsonb_each_text(p_last_used) as u(key_hash, used_at)
+  where k.key_hash = u.key_hash::bytea;
+end;
+$$;
+
+-- AI ranking write: p_ranks maps candidate id -> rank. Only existing candidates of
+-- the timetable are updated; ids that aren't there are ignored, never inserted.
+create or replace function public.update_candidate_ranks(
+  p_timetable_id uuid,
+  p_ranks jsonb
+) returns void
+language plpgsql
+as $$
+begin
+  update public.candidates c
+  set rank = r.rank::int
+  from jsonb_each_text(p_ranks) as r(candidate_id, rank)
+  where c.id = r.candidate_id and c.timetable_id = p_timetable_id;
+end;
+$$;
+
+-- Plan-limited row counts for one user in a single round-trip; each count is
+-- answered from the table's user_id index.
+create or replace function public.count_user_resources(
+  p_user_id uuid
+) returns jsonb
+language sql stable
+as $$
+  select jsonb_build_object(
+    'teachers', (select count(*) from public.teachers where user_id = p_user_id),
+    'rooms', (select count(*) from public.rooms where user_id = p_user_id),
+    'subjects', (select count(*) from public.subjects where user_id = p_user_id),
+    'classes', (select count(*) from public.classes where user_id = p_user_id)
+  );
+$$;
+
+-- Stamp updated_at in the database so API writes don't send a client clock value.
+create or replace function public.set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.updated_at = now();
+  return new;
+end;
+$$;
+
+create trigger profiles_set_updated_at
+before update on public.profiles
+for each row execute function public.set_updated_at();
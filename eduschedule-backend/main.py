@@ -1,10 +1,18 @@
 import os
+import asyncio
 import logging
+from contextlib import asynccontextmanager
+import httpx
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
+from core.dependencies import db, supabase
+from core.rate_limit import limiter
+from core.tokens import jwks_client
+from services.ai_orchestrator import openai_client
 from api.routes import users, teachers, rooms, subjects, classes, auth, timetables, payments, assignments, public_v1, public, schools
 
 # Configure logging
@@ -18,14 +26,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def warm_connections():
+    """Open a pooled connection on both Supabase clients before the first request needs one."""
+    try:
+        # Bounded so an unreachable database can't hold up startup
+        await asyncio.wait_for(asyncio.gather(
+            db.session.head("/"),
+            run_in_threadpool(supabase.postgrest.session.head, "/"),
+        ), timeout=5)
+    except (httpx.HTTPError, asyncio.TimeoutError) as e:
+        logger.warning(f"Supabase connection warm-up failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("EduSchedule API starting up...")
+    logger.info(f"CORS Origins: {origins}")
+    await warm_connections()
+    yield
+    logger.info("EduSchedule API shutting down...")
+    await payments.paystack_client.aclose()
+    await openai_client.close()
+    await db.aclose()
+    await jwks_client.aclose()
+
 app = FastAPI(
     title="EduSchedule API",
     description="Backend services for the EduSchedule AI-assisted timetabling system.",
     version="0.1.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+# Rate limiter shared with the routers (Redis-backed, see core.rate_limit)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -59,12 +91,3 @@ app.include_router(schools.router)
 def read_root():
     logger.info("Root endpoint accessed")
     return {"message": "Welcome to the EduSchedule API!"}
-
-@app.on_event("startup")
-async def startup_event():
-    logger.info("EduSchedule API starting up...")
-    logger.info(f"CORS Origins: {origins}")
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info("EduSchedule API shutting down...")
@@ -1,33 +1,33 @@
-from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator
 from typing import List, Optional, Dict, Any
 from uuid import UUID
 import re
 import html
 
+_HTML_TAG_RE = re.compile('<[^<]+?>')
+
 # --- 1. THE SANITIZER CORE ---
 class SafeBaseModel(BaseModel):
     """
     A base model that sanitizes all string fields to prevent XSS
     and strips leading/trailing whitespace.
     """
-    @model_validator(mode='before')
+    model_config = ConfigDict(from_attributes=True)
+
+    @field_validator('*', mode='before')
     @classmethod
-    def sanitize_strings(cls, data: Any) -> Any:
-        if isinstance(data, dict):
-            new_data = {}
-            for key, value in data.items():
-                if isinstance(value, str):
-                    # 1. Strip whitespace
-                    value = value.strip()
-                    # 2. Basic XSS prevention (strip HTML tags)
-                    # This removes <script> tags and other HTML
-                    clean_value = re.sub('<[^<]+?>', '', value)
-                    # 3. Unescape entities (optional, keeps text readable)
-                    new_data[key] = html.unescape(clean_value)
-                else:
-                    new_data[key] = value
-            return new_data
-        return data
+    def sanitize_strings(cls, value: Any) -> Any:
+        # Runs per field on the raw input, so non-string fields pass straight through
+        if not isinstance(value, str):
+            return value
+        # 1. Strip whitespace
+        value = value.strip()
+        # 2. Basic XSS prevention (strip HTML tags)
+        # This removes <script> tags and other HTML; text without '<' can't hold a tag
+        if '<' in value:
+            value = _HTML_TAG_RE.sub('', value)
+        # 3. Unescape entities (optional, keeps text readable)
+        return html.unescape(value)
 
 # --- 2. ENHANCED USER MODELS ---
 class UserCreate(SafeBaseModel):
@@ -59,6 +59,22 @@ class TeacherBase(SafeBaseModel):
 class TeacherCreate(TeacherBase):
     preferences: Optional[Dict] = {}
 
+class TeacherUpdate(SafeBaseModel):
+    """Fields a PATCH may change; ownership columns (id, user_id, school_id) are not among them."""
+    name: Optional[str] = Field(None, min_length=2, max_length=100)
+    email: Optional[EmailStr] = None
+    subjects: Optional[List[str]] = None
+    preferences: Optional[Dict] = None
+    availability: Optional[Dict] = None
+
+class TeacherListItem(TeacherBase):
+    id: UUID
+
+class TeacherPage(BaseModel):
+    """One keyset page of teachers; next_cursor is null on the last page."""
+    data: List[TeacherListItem]
+    next_cursor: Optional[str] = None
+
 # Base schemas (for reading from API)
 class TeacherRead(SafeBaseModel):
     id: UUID
@@ -1,56 +1,92 @@
 # services/ai_orchestrator.py
 import os
+import httpx
 import google.generativeai as genai
-from openai import OpenAI
+from openai import AsyncOpenAI
 import json
-import statistics
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
 
 # --- Metric Extraction ---
 def extract_metrics(solution, teachers):
     """Calculates key metrics for a given timetable solution."""
-    teacher_load = {t['id']: 0 for t in teachers}
-    for assignment in solution:
-        teacher_load[assignment['teacher_id']] += 1
-    
-    # Fairness: Lower standard deviation is better (more balanced load)
-    load_values = [v for v in teacher_load.values() if v > 0]
-    fairness = statistics.stdev(load_values) if len(load_values) > 1 else 0
+    return extract_metrics_batch([solution], teachers)[0]
 
-    return {
-        "total_periods_scheduled": len(solution),
-        "teacher_workload_stdev": round(fairness, 2),
-        "teachers_used": len(load_values)
-    }
+def extract_metrics_batch(solutions, teachers):
+    """Calculates extract_metrics for every solution in one vectorized pass."""
+    # Column per teacher id seen in any solution; row per solution
+    columns = {}
+    cols = np.fromiter(
+        (columns.setdefault(a['teacher_id'], len(columns)) for solution in solutions for a in solution),
+        dtype=np.int64
+    )
+    sizes = np.fromiter((len(solution) for solution in solutions), dtype=np.int64, count=len(solutions))
+    rows = np.repeat(np.arange(len(solutions)), sizes)
+    width = max(len(columns), 1)
+    loads = np.bincount(rows * width + cols, minlength=len(solutions) * width).reshape(len(solutions), width)
+
+    # Fairness: Lower standard deviation is better (more balanced load).
+    # Computed over the teachers each solution uses; idle teachers add 0 to both sums.
+    used = np.count_nonzero(loads, axis=1)
+    total = loads.sum(axis=1)
+    squares = (loads * loads).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (squares - total * total / used) / (used - 1)
+    fairness = np.where(used > 1, np.sqrt(np.maximum(variance, 0)), 0.0)
+
+    return [
+        {
+            "total_periods_scheduled": int(size),
+            "teacher_workload_stdev": round(float(stdev), 2),
+            "teachers_used": int(count)
+        }
+        for size, stdev, count in zip(sizes, fairness, used)
+    ]
 
 # --- AI Integration ---
 genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
-openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# Async clients: a slow model reply doesn't hold a threadpool thread while it waits.
+# One keep-alive HTTP/2 pool per process, so calls after the first skip the TLS handshake.
+openai_client = AsyncOpenAI(
+    api_key=os.environ.get("OPENAI_API_KEY"),
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    ),
+)
+
+# JSON mode: the reply is a bare JSON document, with no markdown fences to strip
+ranking_model = genai.GenerativeModel(
+    'gemini-1.5-flash',
+    generation_config={'response_mime_type': 'application/json'}
+)
 
-def rank_candidates_with_gemini(candidates_with_metrics: list):
+async def rank_candidates_with_gemini(candidates_with_metrics: list):
     """Uses Gemini to rank timetable candidates."""
-    model = genai.GenerativeModel('gemini-pro')
     
     prompt = f"""
     You are an expert school administrator. Your task is to rank timetable candidates based on quality.
     A good timetable has a low "teacher_workload_stdev" (meaning work is distributed fairly) and uses a reasonable number of teachers.
     
     Here are the candidates and their metrics in JSON format:
-    {json.dumps(candidates_with_metrics, indent=2)}
+    {json.dumps(candidates_with_metrics, separators=(',', ':'))}
 
     Please respond with ONLY a JSON object containing a single key "ranking" which is an array of the candidate IDs, ordered from best to worst.
     Example response: {{"ranking": ["c_id_1", "c_id_3", "c_id_2"]}}
     """
     
-    response = model.generate_content(prompt)
+    response = await ranking_model.generate_content_async(prompt)
     try:
-        # Clean up the response to ensure it's valid JSON
-        cleaned_response = response.text.strip().replace('`', '').replace('json', '')
-        return json.loads(cleaned_response)
-    except (json.JSONDecodeError, AttributeError) as e:
-        print(f"Error parsing Gemini response: {e}")
+        return json.loads(response.text)
+    except (ValueError, AttributeError) as e:  # bad JSON, or .text on a blocked reply
+        logger.error(f"Error parsing Gemini response: {e}")
         return None
 
-def explain_candidate_with_gpt(metrics: dict):
+async def explain_candidate_with_gpt(metrics: dict):
     """Uses GPT to generate a natural language explanation of a timetable."""
     prompt = f"""
     You are a helpful school principal explaining the quality of a generated timetable to an administrator.
@@ -63,7 +99,7 @@ def explain_candidate_with_gpt(metrics: dict):
     Provide a concise explanation.
     """
     
-    response = openai_client.chat.completions.create(
+    response = await openai_client.chat.completions.create(
         model="gpt-3.5-turbo",
         messages=[{"role": "user", "content": prompt}],
         temperature=0.5
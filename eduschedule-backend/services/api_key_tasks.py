@@ -0,0 +1,34 @@
+# eduschedule-backend/services/api_key_tasks.py
+from .celery_app import celery_app
+from core.cache import API_KEY_USAGE_KEY, redis_sync_client as redis_sync
+from core.dependencies import supabase, execute_with_retry
+from core.logger import get_logger
+
+logger = get_logger(__name__)
+
+@celery_app.task(name="services.api_key_tasks.flush_api_key_usage")
+def flush_api_key_usage() -> int:
+    """
+    Write the API key uses recorded since the last run to api_keys.last_used
+    in one RPC. Returns the number of keys touched.
+    """
+    # Read and clear in one MULTI so uses recorded meanwhile wait for the next run
+    pipe = redis_sync.pipeline()
+    pipe.hgetall(API_KEY_USAGE_KEY)
+    pipe.delete(API_KEY_USAGE_KEY)
+    usage, _ = pipe.execute()
+    if not usage:
+        return 0
+
+    try:
+        execute_with_retry(supabase.rpc('touch_api_keys', {'p_last_used': usage}), idempotent=True)
+    except Exception:
+        # Put the batch back without overwriting uses recorded after the drain
+        pipe = redis_sync.pipeline()
+        for key_hash, used_at in usage.items():
+            pipe.hsetnx(API_KEY_USAGE_KEY, key_hash, used_at)
+        pipe.execute()
+        raise
+
+    logger.info(f"Recorded last_used for {len(usage)} API keys")
+    return len(usage)
@@ -0,0 +1,46 @@
+# eduschedule-backend/services/audit_tasks.py
+import orjson
+from postgrest.types import ReturnMethod
+
+from .celery_app import celery_app
+from core.cache import SECURITY_LOG_KEY, redis_sync_client
+from core.dependencies import supabase, execute_with_retry
+from core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Rows per security_log insert
+SECURITY_LOG_BATCH = 500
+
+@celery_app.task(name="services.audit_tasks.flush_security_log")
+def flush_security_log() -> int:
+    """
+    Insert the security events queued by core.rbac.log_rbac_violation,
+    one bulk insert per SECURITY_LOG_BATCH rows. Returns the number written.
+    """
+    written = 0
+    while True:
+        # Take a batch off the head in one MULTI; events queued meanwhile stay for the next loop
+        pipe = redis_sync_client.pipeline()
+        pipe.lrange(SECURITY_LOG_KEY, 0, SECURITY_LOG_BATCH - 1)
+        pipe.ltrim(SECURITY_LOG_KEY, SECURITY_LOG_BATCH, -1)
+        batch, _ = pipe.execute()
+        if not batch:
+            break
+
+        try:
+            execute_with_retry(supabase.table('security_log').insert(
+                [orjson.loads(row) for row in batch], returning=ReturnMethod.minimal
+            ))
+        except Exception:
+            # Back at the head, in order, for the next run
+            redis_sync_client.lpush(SECURITY_LOG_KEY, *reversed(batch))
+            raise
+
+        written += len(batch)
+        if len(batch) < SECURITY_LOG_BATCH:
+            break
+
+    if written:
+        logger.info(f"Wrote {written} security log events")
+    return written
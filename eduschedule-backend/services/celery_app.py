@@ -15,8 +15,9 @@ celery_app = Celery(
     backend=settings.CELERY_RESULT_BACKEND,
     include=[
         'services.tasks',
-        'services.email_tasks',
-        'services.scheduler_tasks'
+        'services.scheduler_tasks',
+        'services.api_key_tasks',
+        'services.audit_tasks'
     ]
 )
 
@@ -41,15 +42,26 @@ celery_app.conf.update(
     task_default_retry_delay=settings.TASK_RETRY_DELAY,
     task_max_retries=settings.TASK_MAX_RETRIES,
 
-    # Task routing
+    # Task routing (keys are the registered task names)
     task_routes={
-        'services.tasks.generate_timetable_task': {'queue': 'high_priority'},
-        'services.tasks.send_email_alert': {'queue': 'low_priority'},
-        'services.tasks.cleanup_old_data': {'queue': 'maintenance'},
-        'services.tasks.backup_database': {'queue': 'maintenance'},
+        'generate_timetable_task': {'queue': 'high_priority'},
+        'services.scheduler_tasks.solve_and_persist': {'queue': 'high_priority'},
+        'send_templated_email': {'queue': 'low_priority'},
+        'send_timetable_notification': {'queue': 'low_priority'},
+        'send_welcome_email': {'queue': 'low_priority'},
+        'send_teacher_invitation': {'queue': 'low_priority'},
+        'send_payment_confirmation': {'queue': 'low_priority'},
+        'cleanup_old_data': {'queue': 'maintenance'},
+        'backup_database': {'queue': 'maintenance'},
     },
 
-    # Queue definitions
+    # Queue definitions. Solver and mail work want different worker settings,
+    # so run a worker per queue group instead of one worker for everything:
+    #   celery -A services.celery_app worker -Q high_priority -c 2 --prefetch-multiplier=1 --max-tasks-per-child=50
+    #   celery -A services.celery_app worker -Q low_priority,default,maintenance -c 8 --prefetch-multiplier=4
+    # Solver tasks run for minutes, so prefetching would only park jobs behind a
+    # busy process, and recycling children often returns OR-Tools heap growth.
+    # Mail tasks are short and I/O-bound, so prefetching hides broker round-trips.
     task_queues=(
         Queue('high_priority', routing_key='high_priority'),
         Queue('low_priority', routing_key='low_priority'),
@@ -76,20 +88,30 @@ celery_app.conf.update(
     # Beat scheduler (for periodic tasks)
     beat_schedule={
         'cleanup-old-timetables': {
-            'task': 'services.tasks.cleanup_old_data',
+            'task': 'cleanup_old_data',
             'schedule': 86400.0,  # Run daily
             'options': {'queue': 'maintenance'}
         },
         'health-check': {
-            'task': 'services.tasks.health_check_task',
+            'task': 'health_check_task',
             'schedule': 300.0,  # Run every 5 minutes
             'options': {'queue': 'maintenance'}
         },
         'backup-database': {
-            'task': 'services.tasks.backup_database',
+            'task': 'backup_database',
             'schedule': 21600.0,  # Run every 6 hours
             'options': {'queue': 'maintenance'}
         },
+        'flush-api-key-usage': {
+            'task': 'services.api_key_tasks.flush_api_key_usage',
+            'schedule': 10.0,  # last_used lags real use by at most ~10 seconds
+            'options': {'queue': 'maintenance'}
+        },
+        'flush-security-log': {
+            'task': 'services.audit_tasks.flush_security_log',
+            'schedule': 10.0,
+            'options': {'queue': 'maintenance'}
+        },
     },
     beat_schedule_filename='celerybeat-schedule',
 
@@ -105,20 +127,20 @@ celery_app.conf.update(
 
 # Task annotations for specific task configurations
 celery_app.conf.task_annotations = {
-    'services.tasks.generate_timetable_task': {
+    'generate_timetable_task': {
         'rate_limit': '10/m',  # Maximum 10 timetable generations per minute
         'soft_time_limit': 1800,  # 30 minutes soft limit
         'time_limit': 3600,  # 1 hour hard limit
         'retry_kwargs': {'max_retries': 3, 'countdown': 60},
         'bind': True,
     },
-    'services.tasks.send_email_alert': {
+    'send_templated_email': {
         'rate_limit': '100/m',  # Maximum 100 emails per minute
         'soft_time_limit': 30,
         'time_limit': 60,
         'retry_kwargs': {'max_retries': 5, 'countdown': 30},
     },
-    'services.tasks.cleanup_old_data': {
+    'cleanup_old_data': {
         'soft_time_limit': 300,  # 5 minutes
         'time_limit': 600,  # 10 minutes
         'retry_kwargs': {'max_retries': 1, 'countdown': 3600},  # Retry after 1 hour
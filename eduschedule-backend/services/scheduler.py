@@ -1,52 +1,41 @@
+import sys
+import time
+from collections import defaultdict
 from ortools.sat.python import cp_model
 from typing import List, Dict, Any
 import logging
 
 logger = logging.getLogger(__name__)
 
-class TimetableSolutionCallback(cp_model.CpSolverSolutionCallback):
-    """Collects multiple solutions found by the solver."""
-
-    def __init__(self, limit: int = 5):
-        cp_model.CpSolverSolutionCallback.__init__(self)
-        self.__solutions = []
-        self.__limit = limit
-        self.__solution_count = 0
-
-    def on_solution_callback(self):
-        self.__solution_count += 1
-        # In a real scenario, you'd extract the variables here.
-        # However, because variable mapping is complex, we often just count here
-        # and extract variables after Solve() using the generic solver object
-        # if we are not using a strictly custom printer.
-        # For this implementation, we will just stop early.
-        if self.__solution_count >= self.__limit:
-            self.StopSearch()
-
-    def solution_count(self):
-        return self.__solution_count
-
 class TimetableScheduler:
     def __init__(self, teachers: List[Dict], rooms: List[Dict], subjects: List[Dict],
                  classes: List[Dict], teacher_subjects: List[Dict],
                  class_subjects: List[Dict] = None,
-                 consecutive_requirements: List[Dict] = None):
+                 consecutive_requirements: List[Dict] = None,
+                 debug: bool = False):
 
-        self.teachers = {t['id']: t for t in teachers}
-        self.rooms = {r['id']: r for r in rooms}
-        self.subjects = {s['id']: s for s in subjects}
-        self.classes = {c['id']: c for c in classes}
+        # Variable names only help when dumping the model; building millions of them costs time and memory
+        self.debug = debug
+
+        # Ids are interned: every assignment key repeats them, and interned keys hash and compare by identity
+        self.teachers = {sys.intern(t['id']): t for t in teachers}
+        self.rooms = {sys.intern(r['id']): r for r in rooms}
+        self.subjects = {sys.intern(s['id']): s for s in subjects}
+        self.classes = {sys.intern(c['id']): c for c in classes}
 
         # 1. Map Teachers to Subjects
         self.teacher_qualifications = {}
+        self.subject_teachers = {}  # inverse, for looking up who can teach a subject
         for ts in teacher_subjects:
-            self.teacher_qualifications.setdefault(ts['teacher_id'], []).append(ts['subject_id'])
+            t_id, s_id = sys.intern(ts['teacher_id']), sys.intern(ts['subject_id'])
+            self.teacher_qualifications.setdefault(t_id, []).append(s_id)
+            self.subject_teachers.setdefault(s_id, []).append(t_id)
 
         # 2. Map Classes to Subjects (Optimization: Only schedule needed subjects)
         self.class_requirements = {}
         if class_subjects:
             for cs in class_subjects:
-                self.class_requirements.setdefault(cs['class_id'], []).append(cs['subject_id'])
+                self.class_requirements.setdefault(sys.intern(cs['class_id']), []).append(sys.intern(cs['subject_id']))
         else:
             # Default: All classes take all subjects (Fallback)
             all_subject_ids = list(self.subjects.keys())
@@ -64,9 +53,27 @@ class TimetableScheduler:
         self.model = cp_model.CpModel()
         self.assignments = {}
 
+        # Inverted indexes over self.assignments, filled as variables are created,
+        # so each constraint reads its variables directly instead of scanning them all
+        self._by_teacher_slot = defaultdict(list)        # (t_id, d, p)
+        self._by_class_slot = defaultdict(list)          # (c_id, d, p)
+        self._by_room_slot = defaultdict(list)           # (r_id, d, p)
+        self._by_class_subject = defaultdict(list)       # (c_id, s_id)
+        self._by_class_subject_slot = defaultdict(list)  # (c_id, s_id, d, p)
+
     def _create_variables(self):
         """Creates decision variables with intelligent filtering."""
+        # Slots each teacher can work; depends only on the teacher, so built once
+        teacher_slots = {}
+        for t_id, t_data in self.teachers.items():
+            t_unavailable = {tuple(slot) for slot in t_data.get('availability', {}).get('unavailable', [])}
+            teacher_slots[t_id] = [(d, p) for d in self.days for p in self.periods if (d, p) not in t_unavailable]
+
         for c_id, c_data in self.classes.items():
+            # Room Capacity Check: the same rooms fit every subject of this class
+            student_count = c_data.get('student_count', 0)
+            suitable_rooms = [r_id for r_id, r_data in self.rooms.items() if student_count <= r_data.get('capacity', 0)]
+
             # Only iterate subjects this class actually takes
             required_subjects = self.class_requirements.get(c_id, [])
 
@@ -75,49 +82,35 @@ class TimetableScheduler:
                 s_data = self.subjects.get(s_id)
                 if not s_data: continue
 
-                # Find valid teachers for this subject
-                valid_teachers = [t_id for t_id, subs in self.teacher_qualifications.items() if s_id in subs]
-
-                for t_id in valid_teachers:
+                for t_id in self.subject_teachers.get(s_id, []):
                     # Teacher Availability Check (Hard Constraint)
-                    t_unavailable = self.teachers[t_id].get('availability', {}).get('unavailable', [])
-
-                    for r_id, r_data in self.rooms.items():
-                        # Room Capacity Check
-                        if c_data.get('student_count', 0) > r_data.get('capacity', 0):
-                            continue
-
-                        for d in self.days:
-                            for p in self.periods:
-                                if [d, p] in t_unavailable:
-                                    continue
-
-                                name = f'{c_id}_{s_id}_{t_id}_{r_id}_{d}_{p}'
-                                self.assignments[(c_id, s_id, t_id, r_id, d, p)] = self.model.NewBoolVar(name)
+                    available_slots = teacher_slots[t_id]
+
+                    for r_id in suitable_rooms:
+                        for d, p in available_slots:
+                            name = f'{c_id}_{s_id}_{t_id}_{r_id}_{d}_{p}' if self.debug else ''
+                            var = self.model.NewBoolVar(name)
+                            self.assignments[(c_id, s_id, t_id, r_id, d, p)] = var
+                            self._by_teacher_slot[(t_id, d, p)].append(var)
+                            self._by_class_slot[(c_id, d, p)].append(var)
+                            self._by_room_slot[(r_id, d, p)].append(var)
+                            self._by_class_subject[(c_id, s_id)].append(var)
+                            self._by_class_subject_slot[(c_id, s_id, d, p)].append(var)
 
     def _apply_hard_constraints(self):
         """Applies physical reality constraints."""
 
         # 1. One Teacher, One Place
-        for t in self.teachers:
-            for d in self.days:
-                for p in self.periods:
-                    self.model.AddAtMostOne([v for (c, s, t_i, r, d_i, p_i), v in self.assignments.items()
-                                           if t_i == t and d_i == d and p_i == p])
+        for slot_vars in self._by_teacher_slot.values():
+            self.model.AddAtMostOne(slot_vars)
 
         # 2. One Class, One Room
-        for c in self.classes:
-            for d in self.days:
-                for p in self.periods:
-                    self.model.AddAtMostOne([v for (c_i, s, t, r, d_i, p_i), v in self.assignments.items()
-                                           if c_i == c and d_i == d and p_i == p])
+        for slot_vars in self._by_class_slot.values():
+            self.model.AddAtMostOne(slot_vars)
 
         # 3. One Room, One Class
-        for r in self.rooms:
-            for d in self.days:
-                for p in self.periods:
-                    self.model.AddAtMostOne([v for (c, s, t, r_i, d_i, p_i), v in self.assignments.items()
-                                           if r_i == r and d_i == d and p_i == p])
+        for slot_vars in self._by_room_slot.values():
+            self.model.AddAtMostOne(slot_vars)
 
         # 4. Subject Frequency & Consecutive Blocks
         for c_id in self.classes:
@@ -128,15 +121,14 @@ class TimetableScheduler:
                 weekly_periods = s_data.get('periods_per_week', 4)
 
                 # Gather all variables for this class-subject pair
-                class_subject_vars = [v for (c, s, t, r, d, p), v in self.assignments.items()
-                                      if c == c_id and s == s_id]
+                class_subject_vars = self._by_class_subject.get((c_id, s_id))
 
                 if not class_subject_vars:
                     # If no valid slots exist (e.g. no teacher qualified), log warning
                     continue
 
                 # Constraint: Total periods per week
-                self.model.Add(sum(class_subject_vars) == weekly_periods)
+                self.model.Add(cp_model.LinearExpr.Sum(class_subject_vars) == weekly_periods)
 
                 # --- Consecutive Logic Implementation ---
                 block_size = self.consecutive_map.get(s_id, 1)
@@ -155,7 +147,7 @@ class TimetableScheduler:
                         valid_start_periods = range(len(self.periods) - block_size + 1)
 
                         for p in valid_start_periods:
-                            start_var = self.model.NewBoolVar(f'start_{c_id}_{s_id}_{d}_{p}')
+                            start_var = self.model.NewBoolVar(f'start_{c_id}_{s_id}_{d}_{p}' if self.debug else '')
                             block_starts.append(start_var)
 
                             # LOGIC: If a block starts at P, then the class MUST be assigned
@@ -163,14 +155,11 @@ class TimetableScheduler:
                             for offset in range(block_size):
                                 target_p = p + offset
                                 # Gather all assignment vars for this Class+Subject at Day+TargetP (across all teachers/rooms)
-                                relevant_assignments = [
-                                    v for (c, s, t, r, d_i, p_i), v in self.assignments.items()
-                                    if c == c_id and s == s_id and d_i == d and p_i == target_p
-                                ]
+                                relevant_assignments = self._by_class_subject_slot.get((c_id, s_id, d, target_p))
 
                                 # If block starts, sum of assignments at P+offset must be 1
                                 if relevant_assignments:
-                                    self.model.Add(sum(relevant_assignments) == 1).OnlyEnforceIf(start_var)
+                                    self.model.Add(cp_model.LinearExpr.Sum(relevant_assignments) == 1).OnlyEnforceIf(start_var)
                                 else:
                                     # If no valid assignment exists at P+offset (e.g., restricted by teacher),
                                     # then a block CANNOT start here.
@@ -178,30 +167,50 @@ class TimetableScheduler:
 
                     # LOGIC: The total number of started blocks must equal the required amount
                     if block_starts:
-                        self.model.Add(sum(block_starts) == num_blocks_needed)
-
-    def solve(self, solution_limit=5):
+                        self.model.Add(cp_model.LinearExpr.Sum(block_starts) == num_blocks_needed)
+
+    def solve(self, solution_limit=5, num_workers=8, max_time_in_seconds=60.0):
+        """
+        Up to `solution_limit` distinct timetables. Each one comes from a full
+        parallel solve; after it, a no-good cut forbids that exact assignment so
+        the next solve must find a different one. All solves share one time budget.
+        """
         self._create_variables()
         self._apply_hard_constraints()
 
         solver = cp_model.CpSolver()
-        solver.parameters.max_time_in_seconds = 60.0
-
-        # Use the callback to stop after finding enough solutions
-        callback = TimetableSolutionCallback(limit=solution_limit)
-        status = solver.Solve(self.model, callback)
-
-        solutions = []
-        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-            # Extract ONE representative solution (since callback logic for extracting ALL is complex)
-            # In a real app, you'd iterate `callback.solutions` if you stored them there.
-            sol_data = []
-            for (c, s, t, r, d, p), var in self.assignments.items():
-                if solver.Value(var):
-                    sol_data.append({
-                        "class_id": c, "subject_id": s, "teacher_id": t,
-                        "room_id": r, "day_of_week": d, "period": p
-                    })
-            solutions.append(sol_data)
-
-        return solutions
+        # Parallel portfolio: several strategies plus LNS race on the same model
+        solver.parameters.num_workers = num_workers
+        solver.parameters.log_search_progress = logger.isEnabledFor(logging.DEBUG)
+        deadline = time.monotonic() + max_time_in_seconds
+
+        # Raw assignment keys per solution; turned into dicts once the search is over
+        found = []
+        while len(found) < solution_limit:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            solver.parameters.max_time_in_seconds = remaining
+
+            status = solver.Solve(self.model)
+            if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+                break
+
+            chosen = [(key, var) for key, var in self.assignments.items() if solver.Value(var)]
+            found.append([key for key, _ in chosen])
+            if not chosen:
+                break  # the empty timetable is the only solution
+
+            # No-good cut: at least one of this solution's lessons must change
+            self.model.AddBoolOr([var.Not() for _, var in chosen])
+
+        return [
+            [
+                {
+                    "class_id": c, "subject_id": s, "teacher_id": t,
+                    "room_id": r, "day_of_week": d, "period": p
+                }
+                for (c, s, t, r, d, p) in keys
+            ]
+            for keys in found
+        ]
@@ -0,0 +1,112 @@
+# eduschedule-backend/services/scheduler_tasks.py
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from postgrest.types import ReturnMethod
+
+from .celery_app import celery_app
+from .scheduler import TimetableScheduler
+from .ai_orchestrator import extract_metrics_batch
+from core.dependencies import supabase, execute_with_retry
+from core.cache import invalidate_public_timetables_sync
+from core.config import get_settings
+from core.logger import get_logger, log_task_execution
+
+settings = get_settings()
+logger = get_logger(__name__)
+
+SCHEDULING_TABLES = ('teachers', 'rooms', 'subjects', 'classes')
+
+def fetch_scheduling_data() -> Dict[str, List[dict]]:
+    """Fetch the solver inputs; the independent selects run concurrently."""
+    with ThreadPoolExecutor(max_workers=len(SCHEDULING_TABLES)) as pool:
+        results = pool.map(
+            lambda table: execute_with_retry(supabase.table(table).select("*"), idempotent=True).data,
+            SCHEDULING_TABLES
+        )
+        return dict(zip(SCHEDULING_TABLES, results))
+
+def run_solver(teachers_data, rooms_data, subjects_data, classes_data, teacher_subjects_data):
+    """Helper function to run solver synchronously"""
+    logger.info(f"Running solver with {len(teachers_data)} teachers, {len(classes_data)} classes")
+    scheduler = TimetableScheduler(teachers_data, rooms_data, subjects_data, classes_data, teacher_subjects_data)
+    solutions = scheduler.solve(solution_limit=settings.SOLUTION_LIMIT, num_workers=settings.SOLVER_NUM_WORKERS)
+    logger.info(f"Solver completed, found {len(solutions)} solutions")
+    return solutions
+
+def persist_solutions(solutions: List[List[dict]], teachers: List[dict]) -> str:
+    """
+    Create the timetable with one candidate per solution. Returns the timetable id.
+    Every row id is generated here and written with an upsert, so a write retried
+    after a transient failure can't duplicate rows. The timetable is deleted again
+    (cascading to its rows) if a write still fails.
+    """
+    timetable_id = str(uuid.uuid4())
+    execute_with_retry(
+        supabase.table('timetables').upsert(
+            {"id": timetable_id, "term": "Fall 2025"}, returning=ReturnMethod.minimal
+        ),
+        idempotent=True
+    )
+
+    try:
+        all_candidates = []
+        all_assignments = []
+        for solution, metrics in zip(solutions, extract_metrics_batch(solutions, teachers)):
+            candidate_id = str(uuid.uuid4())
+            all_candidates.append({
+                "id": candidate_id,
+                "timetable_id": timetable_id,
+                "metrics": metrics
+            })
+            all_assignments.extend(
+                {**assignment, "id": str(uuid.uuid4()), "candidate_id": candidate_id, "timetable_id": timetable_id}
+                for assignment in solution
+            )
+
+        # One bulk write per table instead of two inserts per candidate
+        execute_with_retry(
+            supabase.table('candidates').upsert(all_candidates, returning=ReturnMethod.minimal),
+            idempotent=True
+        )
+        execute_with_retry(
+            supabase.table('assignments').upsert(all_assignments, returning=ReturnMethod.minimal),
+            idempotent=True
+        )
+    except Exception:
+        try:
+            # Delete the timetable and cascade will handle candidates/assignments
+            execute_with_retry(
+                supabase.table('timetables').delete(returning=ReturnMethod.minimal).eq('id', timetable_id),
+                idempotent=True
+            )
+        except Exception:
+            pass  # Best effort cleanup
+        raise
+
+    return timetable_id
+
+@celery_app.task(name="services.scheduler_tasks.solve_and_persist")
+@log_task_execution
+def solve_and_persist() -> Dict[str, Any]:
+    """
+    Generate timetable candidates off the request path.
+    Raises ValueError for inputs that can't produce a timetable; the job then
+    reports a generic failure and the message is only logged.
+    """
+    data = fetch_scheduling_data()
+    # You might need a join table for teacher_subjects in your schema
+    teacher_subjects = []  # Placeholder: fetch this from your relation table
+
+    if not data['teachers'] or not data['classes']:
+        raise ValueError("Insufficient data to generate timetable.")
+
+    solutions = run_solver(data['teachers'], data['rooms'], data['subjects'], data['classes'], teacher_subjects)
+    if not solutions:
+        raise ValueError("Could not find any valid solutions.")
+
+    timetable_id = persist_solutions(solutions, data['teachers'])
+    # Retire the cached public pages now, whether or not anyone polls the job
+    invalidate_public_timetables_sync()
+    return {"message": f"{len(solutions)} candidates generated.", "timetable_id": timetable_id}
@@ -415,16 +415,16 @@ def send_timetable_notification(self, user_id: str, timetable_id: str, status: s
     """
     try:
         # Get real user data from database
-        user_response = supabase.table('profiles').select("email, name").eq('id', user_id).single().execute()
-        if not user_response.data:
+        user_response = supabase.table('profiles').select("email, name").eq('id', user_id).maybe_single().execute()
+        if not user_response or not user_response.data:
             logger.error(f"User {user_id} not found for notification")
             return "User not found"
 
         user_data = user_response.data
 
         # Get real timetable details
-        timetable_response = supabase.table('timetables').select("*").eq('id', timetable_id).single().execute()
-        timetable_data = timetable_response.data if timetable_response.data else {}
+        timetable_response = supabase.table('timetables').select("*").eq('id', timetable_id).maybe_single().execute()
+        timetable_data = timetable_response.data if timetable_response and timetable_response.data else {}
 
         # Determine template and subject based on actual status
         template_map = {
@@ -696,10 +696,10 @@ def send_welcome_email(self, user_id: str, school_id: str):
     """
     try:
         # Get real user and school information from database
-        user_response = supabase.table('profiles').select("email, name").eq('id', user_id).single().execute()
-        school_response = supabase.table('schools').select("name").eq('id', school_id).single().execute()
+        user_response = supabase.table('profiles').select("email, name").eq('id', user_id).maybe_single().execute()
+        school_response = supabase.table('schools').select("name").eq('id', school_id).maybe_single().execute()
 
-        if not user_response.data or not school_response.data:
+        if not user_response or not user_response.data or not school_response or not school_response.data:
             logger.warning(f"User {user_id} or school {school_id} not found for welcome email")
             return "User or school not found"
 
@@ -769,8 +769,8 @@ def send_payment_confirmation(self, user_id: str, transaction_data: Dict[str, An
     """
     try:
         # Get real user data
-        user_response = supabase.table('profiles').select("email, name").eq('id', user_id).single().execute()
-        if not user_response.data:
+        user_response = supabase.table('profiles').select("email, name").eq('id', user_id).maybe_single().execute()
+        if not user_response or not user_response.data:
             logger.warning(f"User {user_id} not found for payment confirmation")
             return "User not found"
 
@@ -0,0 +1,125 @@
+import hashlib
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from api.routes.users import API_KEY_PREFIX, hash_api_key, legacy_hash_api_key, verify_api_key
+from core.cache import api_key_cache
+
+API_KEY = f"{API_KEY_PREFIX}test-key-0123456789abcdef"
+PROFILE = {"id": "user-123", "email": "test@example.com", "role": "admin"}
+
+@pytest.fixture(autouse=True)
+def empty_key_cache():
+    api_key_cache.clear()
+    yield
+    api_key_cache.clear()
+
+@pytest.fixture
+def mock_db():
+    """Patches the key lookup, usage recording and profile fetch around verify_api_key."""
+    with patch("api.routes.users.run_query", new_callable=AsyncMock) as run_query, \
+         patch("api.routes.users.record_api_key_use", new_callable=AsyncMock) as record_use, \
+         patch("api.routes.users.get_profile_cached", new_callable=AsyncMock, return_value=PROFILE):
+        yield run_query, record_use
+
+def key_row(key_hash, is_active=True):
+    return Mock(data={"user_id": "user-123", "is_active": is_active, "key_hash": key_hash})
+
+class TestApiKeyHashing:
+    """Hash formats stored in api_keys.key_hash."""
+
+    def test_new_keys_use_blake2b(self):
+        expected = hashlib.blake2b(API_KEY.encode("ascii"), digest_size=32).hexdigest()
+        assert hash_api_key(API_KEY) == "\\x" + expected
+
+    def test_legacy_keys_use_sha256(self):
+        expected = hashlib.sha256(API_KEY.encode("ascii")).hexdigest()
+        assert legacy_hash_api_key(API_KEY) == "\\x" + expected
+
+class TestVerifyApiKey:
+    """Lookup under both hashes, the legacy rewrite and the rejections."""
+
+    @pytest.mark.asyncio
+    async def test_new_key_returns_profile(self, mock_db):
+        run_query, record_use = mock_db
+        run_query.return_value = key_row(hash_api_key(API_KEY))
+
+        assert await verify_api_key(API_KEY) == PROFILE
+
+        # One lookup, no rewrite for a key already stored as BLAKE2b
+        run_query.assert_awaited_once()
+        lookup = run_query.await_args.args[0]
+        assert lookup.http_method == "GET"
+        record_use.assert_awaited_once()
+        assert record_use.await_args.args[0] == hash_api_key(API_KEY)
+
+    @pytest.mark.asyncio
+    async def test_lookup_matches_either_hash(self, mock_db):
+        run_query, _ = mock_db
+        run_query.return_value = key_row(hash_api_key(API_KEY))
+
+        await verify_api_key(API_KEY)
+
+        key_filter = run_query.await_args.args[0].params["key_hash"]
+        assert hash_api_key(API_KEY) in key_filter
+        assert legacy_hash_api_key(API_KEY) in key_filter
+
+    @pytest.mark.asyncio
+    async def test_legacy_key_is_rewritten_to_blake2b(self, mock_db):
+        run_query, _ = mock_db
+        legacy_hash = legacy_hash_api_key(API_KEY)
+        run_query.side_effect = [key_row(legacy_hash), Mock(data=None)]
+
+        assert await verify_api_key(API_KEY) == PROFILE
+
+        assert run_query.await_count == 2
+        update = run_query.await_args_list[1].args[0]
+        assert update.http_method == "PATCH"
+        assert update.json == {"key_hash": hash_api_key(API_KEY)}
+        assert update.params["key_hash"] == f"eq.{legacy_hash}"
+
+    @pytest.mark.asyncio
+    async def test_cached_key_skips_the_database(self, mock_db):
+        run_query, _ = mock_db
+        run_query.return_value = key_row(hash_api_key(API_KEY))
+
+        await verify_api_key(API_KEY)
+        await verify_api_key(API_KEY)
+
+        run_query.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_unknown_key_is_401(self, mock_db):
+        run_query, record_use = mock_db
+        run_query.return_value = None
+
+        with pytest.raises(HTTPException) as exc:
+            await verify_api_key(API_KEY)
+
+        assert exc.value.status_code == 401
+        assert exc.value.detail == "Invalid API key"
+        record_use.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_wrong_prefix_is_401_without_lookup(self, mock_db):
+        run_query, _ = mock_db
+
+        with pytest.raises(HTTPException) as exc:
+            await verify_api_key("sk_not-one-of-ours")
+
+        assert exc.value.status_code == 401
+        run_query.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_deactivated_key_is_401(self, mock_db):
+        run_query, record_use = mock_db
+        run_query.return_value = key_row(hash_api_key(API_KEY), is_active=False)
+
+        with pytest.raises(HTTPException) as exc:
+            await verify_api_key(API_KEY)
+
+        assert exc.value.status_code == 401
+        assert exc.value.detail == "API key is deactivated"
+        record_use.assert_not_awaited()
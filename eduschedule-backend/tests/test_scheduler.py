@@ -1,3 +1,4 @@
+import time
 import unittest
 from services.scheduler import TimetableScheduler
 
@@ -382,5 +383,74 @@ class TestSchedulerEdgeCases(unittest.TestCase):
         )
 
 
+class TestSchedulerSolutionLimit(unittest.TestCase):
+    """Test the repeated solves that collect several distinct timetables."""
+
+    def setUp(self):
+        """One class taking Math, which either of two teachers can teach in either of two rooms."""
+        self.teachers = [
+            {'id': 't1', 'name': 'Mr. A', 'availability': {}},
+            {'id': 't2', 'name': 'Mr. B', 'availability': {}},
+        ]
+        self.subjects = [
+            {'id': 's1', 'name': 'Math', 'periods_per_week': 2, 'is_consecutive': False},
+        ]
+        self.classes = [{'id': 'c1', 'name': 'Class 1', 'student_count': 20}]
+        self.rooms = [
+            {'id': 'r1', 'name': 'Room 1', 'capacity': 30},
+            {'id': 'r2', 'name': 'Room 2', 'capacity': 30},
+        ]
+        self.teacher_subjects = [
+            {'teacher_id': 't1', 'subject_id': 's1'},
+            {'teacher_id': 't2', 'subject_id': 's1'},
+        ]
+        self.class_subjects = [{'class_id': 'c1', 'subject_id': 's1'}]
+
+    def make_scheduler(self, subjects=None):
+        return TimetableScheduler(
+            self.teachers,
+            self.rooms,
+            subjects or self.subjects,
+            self.classes,
+            self.teacher_subjects,
+            self.class_subjects
+        )
+
+    def test_solution_limit_returns_that_many_distinct_solutions(self):
+        """Test that solution_limit=N yields N different timetables when more exist."""
+        solutions = self.make_scheduler().solve(solution_limit=4, num_workers=1)
+
+        self.assertEqual(len(solutions), 4, "Should return exactly solution_limit solutions")
+        as_sets = {frozenset(tuple(sorted(a.items())) for a in solution) for solution in solutions}
+        self.assertEqual(len(as_sets), 4, "Every returned solution should be different")
+        for solution in solutions:
+            self.assertEqual(len(solution), 2, "Each solution should schedule Math twice")
+
+    def test_infeasible_model_returns_no_solutions(self):
+        """Test that a model with no feasible timetable returns an empty list."""
+        # 41 weekly periods can't fit in a 5-day, 8-period week
+        subjects = [{'id': 's1', 'name': 'Math', 'periods_per_week': 41, 'is_consecutive': False}]
+        solutions = self.make_scheduler(subjects).solve(solution_limit=3, num_workers=1)
+
+        self.assertEqual(solutions, [], "Should return no solutions for an infeasible model")
+
+    def test_exhausted_time_budget_returns_no_solutions(self):
+        """Test that no solve is started once the time budget is used up."""
+        solutions = self.make_scheduler().solve(solution_limit=3, max_time_in_seconds=0)
+
+        self.assertEqual(solutions, [], "Should not search without any time budget")
+
+    def test_deadline_bounds_all_solves(self):
+        """Test that the time budget covers all solves together, not each one."""
+        scheduler = self.make_scheduler()
+
+        start = time.monotonic()
+        solutions = scheduler.solve(solution_limit=100000, num_workers=1, max_time_in_seconds=0.5)
+        elapsed = time.monotonic() - start
+
+        self.assertLess(len(solutions), 100000, "Should stop at the deadline before reaching the limit")
+        self.assertLess(elapsed, 2.0, "Should return shortly after the shared deadline")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, Mock, patch
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jose import JWTError, jwk, jwt
+
+from core import tokens
+from core.dependencies import get_current_user
+from core.tokens import LocalVerificationUnavailable, verify_access_token
+
+SECRET = "test-jwt-secret"
+
+def make_claims(**overrides):
+    now = int(time.time())
+    claims = {
+        "sub": "user-123",
+        "email": "test@example.com",
+        "role": "authenticated",
+        "aud": "authenticated",
+        "iat": now,
+        "exp": now + 3600,
+    }
+    claims.update(overrides)
+    return claims
+
+@pytest.fixture(autouse=True)
+def fresh_jwks(monkeypatch):
+    """Each test starts with an empty JWKS cache and the HS256 secret set."""
+    monkeypatch.setattr(tokens, "_jwks_keys", {})
+    monkeypatch.setattr(tokens, "_jwks_fetched_at", 0.0)
+    monkeypatch.setattr(tokens.settings, "SUPABASE_JWT_SECRET", SECRET)
+
+@pytest.fixture(scope="module")
+def rsa_key():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    public_jwk = {**jwk.construct(public_pem, "RS256").to_dict(), "kid": "key-1"}
+    return private_pem, public_jwk
+
+def jwks_response(*keys):
+    return httpx.Response(200, json={"keys": list(keys)}, request=httpx.Request("GET", tokens.JWKS_URL))
+
+class TestHS256Tokens:
+    """Tokens signed with the project's shared JWT secret."""
+
+    @pytest.mark.asyncio
+    async def test_valid_token_returns_claims(self):
+        token = jwt.encode(make_claims(), SECRET, algorithm="HS256")
+        claims = await verify_access_token(token)
+        assert claims["sub"] == "user-123"
+        assert claims["email"] == "test@example.com"
+
+    @pytest.mark.asyncio
+    async def test_expired_token_rejected(self):
+        token = jwt.encode(make_claims(exp=int(time.time()) - 60), SECRET, algorithm="HS256")
+        with pytest.raises(JWTError):
+            await verify_access_token(token)
+
+    @pytest.mark.asyncio
+    async def test_wrong_secret_rejected(self):
+        token = jwt.encode(make_claims(), "some-other-secret", algorithm="HS256")
+        with pytest.raises(JWTError):
+            await verify_access_token(token)
+
+    @pytest.mark.asyncio
+    async def test_wrong_audience_rejected(self):
+        token = jwt.encode(make_claims(aud="anon"), SECRET, algorithm="HS256")
+        with pytest.raises(JWTError):
+            await verify_access_token(token)
+
+    @pytest.mark.asyncio
+    async def test_malformed_token_rejected(self):
+        with pytest.raises(JWTError):
+            await verify_access_token("not-a-jwt")
+
+    @pytest.mark.asyncio
+    async def test_missing_secret_defers_to_supabase(self, monkeypatch):
+        monkeypatch.setattr(tokens.settings, "SUPABASE_JWT_SECRET", "")
+        token = jwt.encode(make_claims(), SECRET, algorithm="HS256")
+        with pytest.raises(LocalVerificationUnavailable):
+            await verify_access_token(token)
+
+class TestJWKSTokens:
+    """Asymmetric tokens checked against the cached JWKS."""
+
+    @pytest.mark.asyncio
+    async def test_valid_token_fetches_jwks_once(self, rsa_key):
+        private_pem, public_jwk = rsa_key
+        token = jwt.encode(make_claims(), private_pem, algorithm="RS256", headers={"kid": "key-1"})
+
+        with patch.object(tokens.jwks_client, "get", AsyncMock(return_value=jwks_response(public_jwk))) as get:
+            assert (await verify_access_token(token))["sub"] == "user-123"
+            assert (await verify_access_token(token))["sub"] == "user-123"
+        get.assert_awaited_once_with(tokens.JWKS_URL)
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_fetch(self, rsa_key):
+        private_pem, public_jwk = rsa_key
+        token = jwt.encode(make_claims(), private_pem, algorithm="RS256", headers={"kid": "key-1"})
+
+        async def slow_get(url):
+            await asyncio.sleep(0.05)
+            return jwks_response(public_jwk)
+
+        with patch.object(tokens.jwks_client, "get", AsyncMock(side_effect=slow_get)) as get:
+            results = await asyncio.gather(*(verify_access_token(token) for _ in range(5)))
+        assert all(claims["sub"] == "user-123" for claims in results)
+        assert get.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_unknown_kid_defers_to_supabase(self, rsa_key):
+        private_pem, public_jwk = rsa_key
+        token = jwt.encode(make_claims(), private_pem, algorithm="RS256", headers={"kid": "rotated-away"})
+
+        with patch.object(tokens.jwks_client, "get", AsyncMock(return_value=jwks_response(public_jwk))):
+            with pytest.raises(LocalVerificationUnavailable):
+                await verify_access_token(token)
+
+    @pytest.mark.asyncio
+    async def test_jwks_fetch_failure_defers_to_supabase(self, rsa_key):
+        private_pem, _ = rsa_key
+        token = jwt.encode(make_claims(), private_pem, algorithm="RS256", headers={"kid": "key-1"})
+
+        with patch.object(tokens.jwks_client, "get", AsyncMock(side_effect=httpx.ConnectError("down"))):
+            with pytest.raises(LocalVerificationUnavailable):
+                await verify_access_token(token)
+
+class TestGetCurrentUser:
+    """The dependency: local verification first, Supabase Auth as the fallback."""
+
+    @pytest.mark.asyncio
+    async def test_local_token_skips_supabase(self):
+        request = Mock()
+        token = jwt.encode(make_claims(), SECRET, algorithm="HS256")
+
+        with patch("core.dependencies.supabase") as mock_supabase:
+            user = await get_current_user(request, token)
+
+        assert user.id == "user-123"
+        assert request.state.user_id == "user-123"
+        mock_supabase.auth.get_user.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_invalid_token_is_401_without_fallback(self):
+        token = jwt.encode(make_claims(), "some-other-secret", algorithm="HS256")
+
+        with patch("core.dependencies.supabase") as mock_supabase:
+            with pytest.raises(HTTPException) as exc:
+                await get_current_user(Mock(), token)
+
+        assert exc.value.status_code == 401
+        mock_supabase.auth.get_user.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_unverifiable_token_falls_back_to_supabase(self, monkeypatch):
+        monkeypatch.setattr(tokens.settings, "SUPABASE_JWT_SECRET", "")
+        request = Mock()
+        token = jwt.encode(make_claims(), SECRET, algorithm="HS256")
+
+        with patch("core.dependencies.supabase") as mock_supabase:
+            mock_supabase.auth.get_user.return_value.user = Mock(id="user-123")
+            user = await get_current_user(request, token)
+
+        mock_supabase.auth.get_user.assert_called_once_with(token)
+        assert user.id == "user-123"
+        assert request.state.user_id == "user-123"
+
+    @pytest.mark.asyncio
+    async def test_supabase_rejection_is_401(self, monkeypatch):
+        monkeypatch.setattr(tokens.settings, "SUPABASE_JWT_SECRET", "")
+        token = jwt.encode(make_claims(), SECRET, algorithm="HS256")
+
+        with patch("core.dependencies.supabase") as mock_supabase:
+            mock_supabase.auth.get_user.side_effect = Exception("invalid JWT")
+            with pytest.raises(HTTPException) as exc:
+                await get_current_user(Mock(), token)
+
+        assert exc.value.status_code == 401
@@ -0,0 +1,118 @@
+from unittest.mock import AsyncMock, Mock, patch
+
+import fakeredis
+import pytest
+from redis.exceptions import RedisError
+
+from core import permissions
+from core.permissions import USAGE_COUNTER_TTL, get_usage_count, get_user_usage, record_usage_change
+
+USER_ID = "user-123"
+
+@pytest.fixture
+def redis():
+    """An in-memory Redis (with Lua scripting) in place of the shared client."""
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    with patch.object(permissions, "redis_client", client):
+        yield client
+
+def key(table_name):
+    return f"count:{USER_ID}:{table_name}"
+
+class TestRecordUsageChange:
+    """Counters are adjusted only when they are already cached."""
+
+    @pytest.mark.asyncio
+    async def test_missing_counter_is_not_created(self, redis):
+        await record_usage_change(USER_ID, "teachers", 1)
+
+        # A counter made from a delta alone would start from 0, not the real row count
+        assert await redis.get(key("teachers")) is None
+
+    @pytest.mark.asyncio
+    async def test_cached_counter_is_adjusted(self, redis):
+        await redis.set(key("teachers"), 3, ex=USAGE_COUNTER_TTL)
+
+        await record_usage_change(USER_ID, "teachers", 1)
+        assert await redis.get(key("teachers")) == "4"
+
+        await record_usage_change(USER_ID, "teachers", -1)
+        await record_usage_change(USER_ID, "teachers", -1)
+        assert await redis.get(key("teachers")) == "2"
+
+    @pytest.mark.asyncio
+    async def test_failed_adjustment_drops_the_counter(self, redis):
+        await redis.set(key("teachers"), 3)
+
+        with patch.object(redis, "eval", AsyncMock(side_effect=RedisError("timeout"))):
+            await record_usage_change(USER_ID, "teachers", 1)
+
+        # The next check recounts instead of trusting a counter that missed a change
+        assert await redis.get(key("teachers")) is None
+
+class TestGetUsageCount:
+    """Single-resource reads: cached counter, or a count query plus backfill."""
+
+    @pytest.mark.asyncio
+    async def test_miss_counts_and_backfills(self, redis):
+        with patch.object(permissions, "_count_rows", AsyncMock(return_value=4)) as count_rows:
+            assert await get_usage_count(USER_ID, "rooms") == 4
+
+        count_rows.assert_awaited_once_with(USER_ID, "rooms")
+        assert await redis.get(key("rooms")) == "4"
+        assert 0 < await redis.ttl(key("rooms")) <= USAGE_COUNTER_TTL
+
+    @pytest.mark.asyncio
+    async def test_hit_skips_the_count_query(self, redis):
+        await redis.set(key("rooms"), 2)
+
+        with patch.object(permissions, "_count_rows", AsyncMock()) as count_rows:
+            assert await get_usage_count(USER_ID, "rooms") == 2
+
+        count_rows.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_backfill_keeps_a_concurrently_written_counter(self, redis):
+        async def count_while_another_request_backfills(user_id, table_name):
+            # Another request stores (and adjusts) the counter while this count runs
+            await redis.set(key("rooms"), 5)
+            return 4
+
+        with patch.object(permissions, "_count_rows", count_while_another_request_backfills):
+            await get_usage_count(USER_ID, "rooms")
+
+        assert await redis.get(key("rooms")) == "5"
+
+    @pytest.mark.asyncio
+    async def test_redis_failure_falls_back_to_counting(self, redis):
+        with patch.object(redis, "get", AsyncMock(side_effect=RedisError("down"))), \
+             patch.object(permissions, "_count_rows", AsyncMock(return_value=7)):
+            assert await get_usage_count(USER_ID, "rooms") == 7
+
+class TestGetUserUsage:
+    """All resources at once: one MGET, one RPC for the misses."""
+
+    @pytest.mark.asyncio
+    async def test_all_cached_skips_the_rpc(self, redis):
+        for resource, count in zip(permissions.USAGE_RESOURCES, (1, 2, 3, 4)):
+            await redis.set(key(resource), count)
+
+        with patch.object(permissions, "run_query", AsyncMock()) as run_query:
+            usage = await get_user_usage(USER_ID)
+
+        assert usage == {"teachers": 1, "rooms": 2, "subjects": 3, "classes": 4}
+        run_query.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_misses_are_counted_together_and_backfilled(self, redis):
+        await redis.set(key("teachers"), 9)
+        counts = Mock(data={"teachers": 1, "rooms": 2, "subjects": 3, "classes": 4})
+
+        with patch.object(permissions, "run_query", AsyncMock(return_value=counts)) as run_query:
+            usage = await get_user_usage(USER_ID)
+
+        run_query.assert_awaited_once()
+        # The cached counter wins over the RPC's count and is left untouched
+        assert usage == {"teachers": 9, "rooms": 2, "subjects": 3, "classes": 4}
+        assert await redis.mget([key(r) for r in permissions.USAGE_RESOURCES]) == ["9", "2", "3", "4"]
+        assert 0 < await redis.ttl(key("rooms")) <= USAGE_COUNTER_TTL
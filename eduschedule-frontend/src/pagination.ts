@@ -0,0 +1,22 @@
+// The backend's list endpoints return one keyset page at a time:
+// { data: [...], next_cursor: string | null }
+interface Page<T> {
+  data: T[]
+  next_cursor: string | null
+}
+
+// Follows next_cursor until the last page and returns every row
+export async function fetchAllPages<T>(url: string, headers: HeadersInit): Promise<T[]> {
+  const rows: T[] = []
+  let cursor: string | null = null
+  do {
+    const params = new URLSearchParams({ limit: '100' })
+    if (cursor) params.set('cursor', cursor)
+    const response = await fetch(`${url}?${params}`, { headers })
+    if (!response.ok) throw new Error(`Failed to fetch ${url}`)
+    const page: Page<T> = await response.json()
+    rows.push(...page.data)
+    cursor = page.next_cursor
+  } while (cursor)
+  return rows
+}